@@ -0,0 +1,145 @@
+import fcntl
+import functools
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from . import metrics
+from .shared import open_shared
+
+NAMESPACES = ('recipes', 'tags', 'ingredients', 'users')
+VERSION = struct.Struct('<Q')
+
+
+class NamespaceVersions:
+    """Счётчики версий пространств имён в общей памяти воркеров.
+
+    Чтение версии — это чтение восьми байт без блокировок, поэтому
+    проверять её можно на каждый запрос; bump() увеличивает счётчик
+    под блокировкой fcntl.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+
+    def open(self):
+        self.fd, self.mmap = open_shared(
+            self.path, VERSION.size * len(NAMESPACES)
+        )
+        self.pid = os.getpid()
+
+    def offset(self, namespace):
+        if self.pid != os.getpid():
+            self.open()
+        return NAMESPACES.index(namespace) * VERSION.size
+
+    def get(self, namespace):
+        offset = self.offset(namespace)
+        return VERSION.unpack_from(self.mmap, offset)[0]
+
+    def bump(self, namespace):
+        offset = self.offset(namespace)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, VERSION.size, offset)
+        try:
+            version = VERSION.unpack_from(self.mmap, offset)[0] + 1
+            VERSION.pack_into(self.mmap, offset, version)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, VERSION.size, offset)
+
+
+class TwoTierCache:
+    """LRU-кеш процесса (L1) перед общим кешем Django (L2).
+
+    Ключи включают версию пространства имён, поэтому после bump() все
+    воркеры перестают видеть старые записи в обоих уровнях.
+    """
+
+    def __init__(self, versions, max_entries, timeout):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = dict.fromkeys(
+            ('l1_hits', 'l2_hits', 'misses', 'evictions'), 0
+        )
+
+    def count(self, event):
+        self.stats[event] += 1
+        metrics.inc('foodgram_cache_events_total', result=event)
+
+    def make_key(self, namespace, key):
+        """Ключ с текущей версией пространства имён.
+
+        Ключ берётся до чтения данных и им же записывается ответ: если
+        версия сменилась во время запроса, ответ уйдёт под старую.
+        """
+        digest = hashlib.md5(key.encode()).hexdigest()
+        return f'{namespace}:{self.versions.get(namespace)}:{digest}'
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.count('l1_hits')
+                return entry[1]
+        value = cache.get(key)
+        if value is None:
+            self.count('misses')
+            return None
+        self.count('l2_hits')
+        self.store(key, value)
+        return value
+
+    def set(self, key, value):
+        cache.set(key, value)
+        self.store(key, value)
+
+    def store(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.count('evictions')
+
+    def bump(self, *namespaces):
+        for namespace in namespaces:
+            self.versions.bump(namespace)
+
+
+api_cache = TwoTierCache(
+    NamespaceVersions(settings.CACHE_VERSIONS_PATH),
+    settings.CACHE_L1_MAX_ENTRIES,
+    settings.CACHE_L1_TIMEOUT,
+)
+
+
+def cached_response(namespace, anonymous_only=False):
+    """Кеширует данные успешного ответа по полному URL запроса."""
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            if anonymous_only and request.user.is_authenticated:
+                return handler(self, request, *args, **kwargs)
+            key = api_cache.make_key(namespace, request.build_absolute_uri())
+            data = api_cache.get(key)
+            if data is not None:
+                return Response(data)
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                api_cache.set(key, response.data)
+            return response
+        return wrapper
+    return decorator
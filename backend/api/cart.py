@@ -0,0 +1,75 @@
+import csv
+import hashlib
+import io
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, Shopping_list
+
+from .cache import api_cache
+
+CART_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', 'shopping.txt'),
+    'csv': ('text/csv; charset=utf-8', 'shopping.csv'),
+}
+
+
+def get_cart_fingerprint(user):
+    """Отпечаток корзины: её рецепты, их updated_at и версия ингредиентов.
+
+    Считается одним запросом по индексу cart_is_unique, без
+    суммирования ингредиентов. Одинаковые корзины разных
+    пользователей дают один отпечаток и делят готовый документ.
+    """
+    recipes = Shopping_list.objects.filter(user=user).order_by(
+        'recipe_id'
+    ).values_list('recipe_id', 'recipe__updated_at')
+    digest = hashlib.sha256(
+        ','.join(
+            f'{recipe_id}:{updated_at.timestamp()}'
+            for recipe_id, updated_at in recipes
+        ).encode()
+    )
+    digest.update(f':{api_cache.versions.get("ingredients")}'.encode())
+    return digest.hexdigest()[:32]
+
+
+def get_cart_ingredients(user):
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_list__user=user,
+        recipe__is_deleted=False
+    ).values(
+        'ingredient'
+    ).order_by(
+        'ingredient__name'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).values_list(
+        'ingredient__name', 'total_amount', 'ingredient__measurement_unit'
+    )
+
+
+def render_cart(user, cart_format):
+    ingredients = get_cart_ingredients(user)
+    if cart_format == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for name, total_amount, measurement_unit in ingredients:
+            writer.writerow((name, measurement_unit, total_amount))
+        return output.getvalue().encode()
+    return ''.join(
+        f'{name} ({measurement_unit}) - {total_amount}\n'
+        for name, total_amount, measurement_unit in ingredients
+    ).encode()
+
+
+def get_cart_document(user, cart_format, fingerprint):
+    """Готовый список покупок из кеша или только что собранный."""
+    key = f'cart:{fingerprint}:{cart_format}'
+    document = cache.get(key)
+    if document is None:
+        document = render_cart(user, cart_format)
+        cache.set(key, document)
+    return document
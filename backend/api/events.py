@@ -0,0 +1,254 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+from users.models import Subscription
+
+from .sync import make_token, parse_token
+
+
+class EventBus:
+    """Pub/sub внутри процесса: очереди подключённых клиентов по user_id."""
+
+    def __init__(self):
+        self.listeners = {}
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        self.listeners.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.listeners.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.listeners.pop(user_id, None)
+
+    def publish(self, user_ids, event):
+        for user_id in user_ids:
+            for queue in self.listeners.get(user_id, ()):
+                queue.put_nowait(event)
+
+
+def get_event(recipe):
+    return {
+        'id': recipe.id,
+        'updated_at': recipe.updated_at.isoformat(),
+        'token': make_token(recipe.updated_at),
+        'name': recipe.name,
+        'image': recipe.image.url if recipe.image else None,
+        'cooking_time': recipe.cooking_time,
+        'author': {
+            'id': recipe.author_id,
+            'username': recipe.author.username,
+        },
+    }
+
+
+def get_event_key(event):
+    return event['id'], event['updated_at']
+
+
+def get_recipes(since, author_ids=None, limit=None):
+    """Рецепты, изменённые позже since - SYNC_LAG.
+
+    id и updated_at назначаются до коммита, поэтому рецепт может
+    появиться в базе позже рецепта с большим updated_at; перекрытие в
+    SYNC_LAG не даёт его потерять, а повторы отсеиваются по
+    (id, updated_at).
+    """
+    recipes = Recipe.objects.filter(
+        updated_at__gt=since - settings.SYNC_LAG, is_deleted=False
+    ).select_related('author').order_by('updated_at', 'id')
+    if author_ids is not None:
+        recipes = recipes.filter(author_id__in=author_ids)
+    return list(recipes[:limit] if limit else recipes)
+
+
+class RecipeFeed:
+    """Доставка новых рецептов подписчикам, подключённым к процессу.
+
+    Рецепты создают WSGI-воркеры, поэтому между процессами события
+    передаёт база: одна задача на процесс раз в SSE_POLL_INTERVAL
+    читает рецепты, изменённые после последнего доставленного, и
+    раздаёт их через EventBus подписчикам автора. Число запросов не
+    зависит от числа клиентов.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.task = None
+        self.since = None
+        self.delivered = set()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        if self.since is None:
+            self.since = timezone.now()
+            self.delivered = set()
+        while self.bus.listeners:
+            await asyncio.sleep(settings.SSE_POLL_INTERVAL)
+            deliveries = await sync_to_async(self.poll)(
+                set(self.bus.listeners)
+            )
+            for event, user_ids in deliveries:
+                self.bus.publish(user_ids, event)
+        self.since = None
+
+    def poll(self, user_ids):
+        close_old_connections()
+        recipes = get_recipes(self.since)
+        # Следующее окно начинается не раньше этого, поэтому ключей
+        # текущего окна хватает, чтобы не доставить рецепт дважды.
+        delivered = self.delivered
+        self.delivered = {
+            (recipe.id, recipe.updated_at.isoformat()) for recipe in recipes
+        }
+        recipes = [
+            recipe for recipe in recipes
+            if (recipe.id, recipe.updated_at.isoformat()) not in delivered
+        ]
+        if recipes:
+            self.since = max(self.since, recipes[-1].updated_at)
+        followers = {}
+        for author_id, user_id in Subscription.objects.filter(
+            author_id__in={recipe.author_id for recipe in recipes},
+            user_id__in=user_ids
+        ).values_list('author_id', 'user_id'):
+            followers.setdefault(author_id, set()).add(user_id)
+        return [
+            (get_event(recipe), followers.get(recipe.author_id, ()))
+            for recipe in recipes
+        ]
+
+
+bus = EventBus()
+feed = RecipeFeed(bus)
+
+
+def get_user_id(token):
+    close_old_connections()
+    return Token.objects.filter(
+        key=token, user__is_active=True
+    ).values_list('user_id', flat=True).first()
+
+
+def get_backlog(user_id, since):
+    close_old_connections()
+    author_ids = Subscription.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True
+    )
+    return [
+        get_event(recipe) for recipe in get_recipes(
+            since, list(author_ids), settings.SSE_BACKLOG_LIMIT
+        )
+    ]
+
+
+def format_event(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return (
+        f'id: {event["token"]}\nevent: recipe\ndata: {data}\n\n'.encode()
+    )
+
+
+async def send_response(send, status, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def recipe_events(scope, receive, send):
+    """SSE-поток новых и изменённых рецептов авторов из подписок.
+
+    Токен принимается только в заголовке Authorization: параметр
+    запроса попадал бы в логи доступа. id события — токен времени
+    изменения рецепта; после переподключения рецепты, изменённые позже
+    Last-Event-ID (с перекрытием SYNC_LAG), досылаются из базы, и
+    клиент отбрасывает повторы по (id, updated_at).
+    """
+    headers = dict(scope['headers'])
+    query = parse_qs(scope['query_string'].decode())
+    authorization = headers.get(b'authorization', b'').decode().split()
+    token = authorization[1] if len(authorization) == 2 else None
+    user_id = await sync_to_async(get_user_id)(token) if token else None
+    if user_id is None:
+        await send_response(send, 401, json.dumps(
+            {'detail': 'Учетные данные не были предоставлены.'},
+            ensure_ascii=False
+        ).encode())
+        return
+    last_event_id = headers.get(b'last-event-id', b'').decode() or (
+        query.get('last_event_id', [''])[0]
+    )
+    queue = bus.subscribe(user_id)
+    feed.start()
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        replayed = set()
+        try:
+            since = parse_token(last_event_id)
+        except (ValueError, OverflowError, OSError):
+            since = None
+        if since is not None:
+            for event in await sync_to_async(get_backlog)(user_id, since):
+                await send_event(send, event)
+                replayed.add(get_event_key(event))
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                (getter, disconnected), timeout=settings.SSE_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected.done():
+                getter.cancel()
+                break
+            if not getter.done():
+                getter.cancel()
+                await send_body(send, b': ping\n\n')
+                continue
+            event = getter.result()
+            if get_event_key(event) not in replayed:
+                await send_event(send, event)
+    except OSError:
+        pass
+    finally:
+        disconnected.cancel()
+        bus.unsubscribe(user_id, queue)
+
+
+async def send_event(send, event):
+    await send_body(send, format_event(event))
+
+
+async def send_body(send, body):
+    await send({
+        'type': 'http.response.body', 'body': body, 'more_body': True
+    })
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
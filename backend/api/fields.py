@@ -1,9 +1,12 @@
 import base64
+import time
 
 import webcolors
 from django.core.files.base import ContentFile
 from rest_framework import serializers
 
+from . import metrics
+
 
 class ColorNameConverter(serializers.Field):
     def to_representation(self, value):
@@ -20,8 +23,17 @@ class ColorNameConverter(serializers.Field):
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        started = time.perf_counter()
+        try:
+            if isinstance(data, str) and data.startswith('data:image'):
+                format, imgstr = data.split(';base64,')
+                ext = format.split('/')[-1]
+                data = ContentFile(
+                    base64.b64decode(imgstr), name='temp.' + ext
+                )
+            return super().to_internal_value(data)
+        finally:
+            metrics.observe(
+                'foodgram_image_processing_seconds',
+                time.perf_counter() - started
+            )
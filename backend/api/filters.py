@@ -1,22 +1,34 @@
+from django.db.models import F
 from django_filters.rest_framework import (
     BooleanFilter,
+    ChoiceFilter,
     FilterSet,
     ModelMultipleChoiceFilter,
     NumberFilter,
 )
 
-from recipes.models import Recipe, Tag
+from recipes.models import Recipe, Tag, get_bits_mask
 
 
 class RecipeFilter(FilterSet):
     tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='get_tags',
+    )
+    tags_all = ModelMultipleChoiceFilter(
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        method='get_tags',
     )
 
     author = NumberFilter(field_name='author', lookup_expr='exact')
 
+    ordering = ChoiceFilter(
+        choices=(('trending', 'trending'),),
+        method='get_ordering',
+    )
+
     is_favorited = BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='get_is_in_shopping_cart')
 
@@ -24,12 +36,35 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """Любой из тегов (tags) или все теги сразу (tags_all)."""
+        if not value:
+            return queryset
+        if any(tag.bit is None for tag in value):
+            if name == 'tags_all':
+                for tag in value:
+                    queryset = queryset.filter(tags=tag)
+                return queryset
+            return queryset.filter(tags__in=value).distinct()
+        mask = get_bits_mask(tag.bit for tag in value)
+        queryset = queryset.alias(matched_tags=F('tags_mask').bitand(mask))
+        if name == 'tags_all':
+            return queryset.filter(matched_tags=mask)
+        return queryset.filter(matched_tags__gt=0)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by('-trending_score', '-id')
+
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite_recipe__user=self.request.user)
-        return queryset
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(favorite__user=self.request.user)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_recipe__user=self.request.user)
-        return queryset
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(shopping_list__user=self.request.user)
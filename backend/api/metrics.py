@@ -0,0 +1,318 @@
+import bisect
+import fcntl
+import functools
+import glob
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .shared import open_shared
+
+HEADER = struct.Struct('<Q')
+ENTRY = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+MERGED_NAME = 'merged'
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+METRICS = {
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса по маршруту', LATENCY_BUCKETS
+    ),
+    'foodgram_http_responses_total': (
+        'counter', 'Ответы по маршруту, методу и коду', None
+    ),
+    'foodgram_db_queries_per_request': (
+        'histogram', 'Число SQL-запросов на HTTP-запрос',
+        QUERY_COUNT_BUCKETS
+    ),
+    'foodgram_db_duration_seconds': (
+        'histogram', 'Суммарное время SQL-запросов на HTTP-запрос',
+        LATENCY_BUCKETS
+    ),
+    'foodgram_cache_events_total': (
+        'counter', 'Обращения к кешу ответов по результату', None
+    ),
+    'foodgram_image_processing_seconds': (
+        'histogram', 'Время декодирования и проверки картинок',
+        LATENCY_BUCKETS
+    ),
+}
+
+
+class MetricsStore:
+    """Счётчики процесса в отдельном файле, отображённом в память.
+
+    Каждый процесс пишет только в свой файл metrics-<pid>.db, поэтому
+    запись не требует блокировок между процессами. Файл — это длина
+    занятой части и записи «длина ключа, ключ, значение double».
+    /metrics читает и суммирует файлы всех процессов; файлы
+    завершившихся воркеров gunicorn сливает в metrics-merged.db.
+    """
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def path(self, name):
+        return os.path.join(self.directory, f'metrics-{name}.db')
+
+    def open(self, name=None):
+        os.makedirs(self.directory, exist_ok=True)
+        self.fd, self.mmap = open_shared(
+            self.path(name or os.getpid()), self.size
+        )
+        self.offsets = dict(read_entries(self.mmap))
+        self.used = HEADER.unpack_from(self.mmap)[0] or HEADER.size
+        self.pid = os.getpid()
+
+    def close(self):
+        self.mmap.close()
+        os.close(self.fd)
+        self.pid = None
+
+    def inc(self, key, amount=1):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.open()
+            self.add(key, amount)
+
+    def add(self, key, amount):
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self.allocate(key)
+            if offset is None:
+                return
+        VALUE.pack_into(
+            self.mmap, offset, VALUE.unpack_from(self.mmap, offset)[0]
+            + amount
+        )
+
+    def allocate(self, key):
+        encoded = key.encode()
+        padded = (len(encoded) + ENTRY.size + 7) // 8 * 8 - ENTRY.size
+        offset = self.used + ENTRY.size + padded
+        if offset + VALUE.size > self.size:
+            return None
+        ENTRY.pack_into(self.mmap, self.used, len(encoded))
+        start = self.used + ENTRY.size
+        self.mmap[start:start + len(encoded)] = encoded
+        self.used = offset + VALUE.size
+        HEADER.pack_into(self.mmap, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    @contextmanager
+    def locked(self, operation):
+        """Блокировка между /metrics и слиянием файлов процессов."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    def collect(self):
+        """Суммирует значения всех процессов, включая завершившиеся.
+
+        Из каждого файла читается только занятая часть.
+        """
+        totals = {}
+        with self.locked(fcntl.LOCK_SH):
+            for path in glob.glob(self.path('*')):
+                data = read_used(path)
+                for key, offset in read_entries(data):
+                    totals[key] = (
+                        totals.get(key, 0) + VALUE.unpack_from(data, offset)[0]
+                    )
+        return totals
+
+    def merge(self, pid):
+        """Переносит значения завершившегося процесса в metrics-merged.db.
+
+        Вызывается из мастера gunicorn (child_exit); под блокировкой
+        /metrics не увидит значения дважды или ни разу.
+        """
+        path = self.path(pid)
+        with self.locked(fcntl.LOCK_EX):
+            try:
+                data = read_used(path)
+            except FileNotFoundError:
+                return
+            merged = MetricsStore(self.directory, self.size)
+            merged.open(MERGED_NAME)
+            try:
+                for key, offset in read_entries(data):
+                    merged.add(key, VALUE.unpack_from(data, offset)[0])
+            finally:
+                merged.close()
+            os.remove(path)
+
+
+def read_used(path):
+    with open(path, 'rb') as metrics_file:
+        header = metrics_file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return header
+        used = HEADER.unpack(header)[0]
+        return header + metrics_file.read(max(used - HEADER.size, 0))
+
+
+def read_entries(data):
+    if len(data) < HEADER.size:
+        return
+    used = HEADER.unpack_from(data)[0]
+    position = HEADER.size
+    while position < used:
+        length = ENTRY.unpack_from(data, position)[0]
+        key = bytes(data[position + ENTRY.size:position + ENTRY.size + length])
+        padded = (length + ENTRY.size + 7) // 8 * 8 - ENTRY.size
+        offset = position + ENTRY.size + padded
+        yield key.decode(), offset
+        position = offset + VALUE.size
+
+
+store = MetricsStore(settings.METRICS_DIR, settings.METRICS_FILE_SIZE)
+
+
+@functools.lru_cache(maxsize=4096)
+def make_key(name, labels):
+    return name + '{' + ','.join(
+        f'{label}="{value}"' for label, value in labels
+    ) + '}'
+
+
+@functools.lru_cache(maxsize=1024)
+def histogram_keys(name, labels):
+    bounds = [str(bound) for bound in METRICS[name][2]] + ['+Inf']
+    return (
+        [make_key(name + '_bucket', labels + (('le', le),)) for le in bounds],
+        make_key(name + '_sum', labels),
+        make_key(name + '_count', labels),
+    )
+
+
+def inc(name, amount=1, **labels):
+    store.inc(make_key(name, tuple(sorted(labels.items()))), amount)
+
+
+def observe(name, value, **labels):
+    """Добавляет наблюдение в гистограмму.
+
+    Корзины хранятся не накопленными (счётчик первой подходящей
+    границы), накопленные значения считаются при выдаче.
+    """
+    buckets, sum_key, count_key = histogram_keys(
+        name, tuple(sorted(labels.items()))
+    )
+    store.inc(buckets[bisect.bisect_left(METRICS[name][2], value)])
+    store.inc(sum_key, value)
+    store.inc(count_key)
+
+
+class QueryTimer:
+    """execute_wrapper, считающий число и время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def record_request(route, method, status, duration, queries):
+    observe(
+        'foodgram_http_request_duration_seconds', duration, route=route
+    )
+    inc(
+        'foodgram_http_responses_total', route=route, method=method,
+        status=status
+    )
+    observe(
+        'foodgram_db_queries_per_request', queries.count, route=route
+    )
+    observe('foodgram_db_duration_seconds', queries.duration, route=route)
+
+
+class MetricsMiddleware:
+    """Записывает длительность, код ответа и SQL каждого запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        started = time.perf_counter()
+        # Не execute_wrapper(): он снимает последний обработчик, а
+        # ProfilingMiddleware может оставить свой до конца потоковой отдачи.
+        # Чтение может уйти на реплику, поэтому считаются все базы.
+        wrapped = [connections[alias] for alias in connections]
+        for connection in wrapped:
+            connection.execute_wrappers.append(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(queries)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        record_request(
+            match.view_name if match else 'unmatched', request.method,
+            response.status_code, duration, queries
+        )
+        return response
+
+
+def render():
+    """Значения всех процессов в текстовом формате Prometheus."""
+    families = {}
+    for key, value in store.collect().items():
+        name, labels = key[:-1].split('{', 1)
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                family = name[:-len(suffix)]
+        families.setdefault(family, []).append((name, labels, value))
+    lines = []
+    for family in sorted(families):
+        kind, description, buckets = METRICS.get(
+            family, ('untyped', family, None)
+        )
+        lines.append(f'# HELP {family} {description}')
+        lines.append(f'# TYPE {family} {kind}')
+        samples = families[family]
+        if buckets:
+            samples = cumulate_buckets(family, buckets, samples)
+        for name, labels, value in samples:
+            lines.append(f'{name}{{{labels}}} {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def cumulate_buckets(family, buckets, samples):
+    """Переводит корзины в накопленный вид и дописывает пустые."""
+    series = {}
+    result = []
+    for name, labels, value in sorted(samples):
+        if name == family + '_bucket':
+            labels, le = labels.rsplit('le="', 1)
+            series.setdefault(labels, {})[le[:-1]] = value
+        else:
+            result.append((name, labels, value))
+    for labels, counts in sorted(series.items()):
+        total = 0.0
+        for le in [str(bound) for bound in buckets] + ['+Inf']:
+            total += counts.get(le, 0)
+            result.append((family + '_bucket', f'{labels}le="{le}"', total))
+    return result
@@ -0,0 +1,217 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+class StackSampler(threading.Thread):
+    """Раз в interval секунд снимает стек потока, обрабатывающего запрос.
+
+    Стеки копятся в формате collapsed («a;b;c число»), который
+    понимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{code.co_name} '
+                    f'({os.path.basename(code.co_filename)}:'
+                    f'{code.co_firstlineno})'
+                )
+                frame = frame.f_back
+            stack = ';'.join(reversed(stack))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+        return self.stacks
+
+
+class SQLTimeline:
+    """execute_wrapper, записывающий начало, длительность и текст SQL."""
+
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'start': round(started - self.started, 6),
+                'duration': round(time.perf_counter() - started, 6),
+                'sql': sql,
+            })
+
+
+class ProfileStore:
+    """Каталог с последними keep профилями; старые удаляются при записи.
+
+    Профиль — это <id>.json (запрос, время, SQL) и <id>.folded (стеки).
+    """
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+
+    def path(self, profile_id, extension):
+        return os.path.join(self.directory, f'{profile_id}.{extension}')
+
+    def new_id(self):
+        return f'{time.time_ns()}-{os.getpid()}'
+
+    def save(self, profile_id, meta, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(profile_id, 'folded'), 'w') as folded:
+            for stack, count in stacks.items():
+                folded.write(f'{stack} {count}\n')
+        with open(self.path(profile_id, 'json'), 'w') as meta_file:
+            json.dump({'id': profile_id, **meta}, meta_file)
+        for old_id in self.list()[self.keep:]:
+            for extension in ('json', 'folded'):
+                try:
+                    os.remove(self.path(old_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        """Идентификаторы профилей, новые первыми."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            (
+                name[:-len('.json')] for name in os.listdir(self.directory)
+                if name.endswith('.json')
+            ),
+            key=lambda profile_id: int(profile_id.split('-')[0]),
+            reverse=True
+        )
+
+    def load(self, profile_id):
+        with open(self.path(profile_id, 'json')) as meta_file:
+            return json.load(meta_file)
+
+
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_KEEP)
+
+
+def is_staff(request):
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    try:
+        user_auth = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return user_auth is not None and user_auth[0].is_staff
+
+
+class RequestProfile:
+    """Сэмплер и SQL-таймлайн одного запроса.
+
+    finish() вызывается и из генератора потокового ответа, и из его
+    close(), поэтому выполняется один раз и из любого потока: обёртка
+    снимается с тех же объектов соединений, на которые ставилась.
+    """
+
+    def __init__(self, request):
+        self.id = profile_store.new_id()
+        self.request = request
+        self.started = time.perf_counter()
+        self.timeline = SQLTimeline(self.started)
+        self.sampler = StackSampler(
+            threading.get_ident(), settings.PROFILE_INTERVAL
+        )
+        self.connections = [connections[alias] for alias in connections]
+        self.lock = threading.Lock()
+        self.finished = False
+
+    def start(self):
+        for connection in self.connections:
+            connection.execute_wrappers.append(self.timeline)
+        self.sampler.start()
+
+    def finish(self, response):
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+        duration = time.perf_counter() - self.started
+        stacks = self.sampler.stop()
+        for connection in self.connections:
+            connection.execute_wrappers.remove(self.timeline)
+        profile_store.save(self.id, {
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'status': response.status_code if response else 500,
+            'created': time.time(),
+            'duration': round(duration, 6),
+            'sql': self.timeline.queries,
+        }, stacks)
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос сотрудника по ?profile=1 или заголовку X-Profile.
+
+    Остальные запросы проходят без накладных расходов, кроме проверки
+    параметра. Id профиля возвращается в заголовке X-Profile-Id;
+    потоковые ответы профилируются до конца отдачи или до close(),
+    если клиент ушёл раньше.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (
+            request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+        ) or not is_staff(request):
+            return self.get_response(request)
+        profile = RequestProfile(request)
+        profile.start()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            profile.finish(None)
+            raise
+        response['X-Profile-Id'] = profile.id
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, profile, response
+            )
+            # Генератор, который так и не начали читать, не выполнит
+            # finally, а close() ответа сервер вызывает всегда.
+            response._resource_closers.append(
+                lambda: profile.finish(response)
+            )
+        else:
+            profile.finish(response)
+        return response
+
+    def stream(self, content, profile, response):
+        try:
+            yield from content
+        finally:
+            profile.finish(response)
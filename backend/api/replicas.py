@@ -0,0 +1,190 @@
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+API_PREFIX = '/api/'
+# Токен, выданный секунду назад, может ещё не дойти до реплики.
+PRIMARY_APPS = ('authtoken', 'sessions')
+STICKY_COOKIE = 'replica_sticky'
+# Отставание считается нулевым, если реплика применила всё, что получила:
+# иначе при простое основной базы «отставание» растёт без записей.
+LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE EXTRACT(EPOCH FROM '
+    'now() - pg_last_xact_replay_timestamp()) END'
+)
+
+state = threading.local()
+
+
+def check_replica(alias):
+    """Реплика доступна и отстаёт не больше REPLICA_MAX_LAG секунд."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('SELECT 1')
+                return True
+            cursor.execute(LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        connection.close()
+        return False
+    # NULL вне режима восстановления: «реплика» — самостоятельная база.
+    return lag is None or lag <= settings.REPLICA_MAX_LAG
+
+
+class ReplicaHealth:
+    """Состояние реплик в процессе.
+
+    Реплики раз в REPLICA_HEALTH_INTERVAL проверяет фоновый поток, а
+    запрос только читает последний результат. Поток запускается при
+    первом выборе реплики в каждом процессе: после fork воркера gunicorn
+    потоки мастера не работают. До первой проверки реплика считается
+    недоступной.
+    """
+
+    def __init__(self):
+        self.healthy = {}
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        threading.Thread(
+            target=self.run, name='replica-health', daemon=True
+        ).start()
+
+    def run(self):
+        while True:
+            try:
+                self.check()
+            finally:
+                # Соединения потока не держатся открытыми между проверками.
+                connections.close_all()
+            time.sleep(settings.REPLICA_HEALTH_INTERVAL)
+
+    def check(self):
+        for alias in settings.DATABASE_REPLICAS:
+            try:
+                self.healthy[alias] = check_replica(alias)
+            except Exception:
+                self.healthy[alias] = False
+
+    def is_healthy(self, alias):
+        return self.healthy.get(alias, False)
+
+    def mark_down(self, alias):
+        self.healthy[alias] = False
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    health.start()
+    replicas = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if health.is_healthy(alias)
+    ]
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """Чтение безопасных запросов к API с реплик, запись в основную базу.
+
+    После первой записи в запросе чтение тоже идёт в основную базу.
+    Вне ReplicaMiddleware (команды, воркеры, SSE) реплики не используются.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            getattr(state, 'wrote', False)
+            or not getattr(state, 'use_replica', False)
+            or model._meta.app_label in PRIMARY_APPS
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = choose_replica()
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def is_sticky(request):
+    """Клиент недавно писал: кука хранит время, до которого читать с мастера.
+
+    Кука, а не общий кеш: запрос не обращается ни к диску, ни к сети.
+    """
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик для GET/HEAD/OPTIONS к /api/.
+
+    Клиент, который что-то записал, REPLICA_STICKY_SECONDS читает
+    из основной базы и видит свои изменения, даже если реплика отстаёт.
+    Реплика, на которой запрос упал с ошибкой базы, считается
+    недоступной до следующей проверки, а запрос повторяется на основной
+    базе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.use_replica = (
+            bool(settings.DATABASE_REPLICAS)
+            and request.method in SAFE_METHODS
+            and request.path.startswith(API_PREFIX)
+            and not is_sticky(request)
+        )
+        state.alias = None
+        state.wrote = False
+        try:
+            response = self.get_response(request)
+            if state.wrote and settings.DATABASE_REPLICAS:
+                response.set_cookie(
+                    STICKY_COOKIE,
+                    str(time.time() + settings.REPLICA_STICKY_SECONDS),
+                    max_age=settings.REPLICA_STICKY_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+            return response
+        finally:
+            state.use_replica = False
+            state.wrote = False
+
+    def process_exception(self, request, exception):
+        alias = getattr(state, 'alias', None)
+        if not isinstance(exception, DatabaseError) or alias in (
+            None, DEFAULT_DB_ALIAS
+        ):
+            return None
+        health.mark_down(alias)
+        # Повторяется только вьюха: ответ ещё пройдёт через промежуточные
+        # слои обычным путём, как если бы первая попытка удалась.
+        state.use_replica = False
+        state.alias = None
+        match = request.resolver_match
+        return match.func(request, *match.args, **match.kwargs)
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.core.validators import RegexValidator
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework.serializers import (
     CharField,
@@ -7,22 +9,54 @@ from rest_framework.serializers import (
     ModelSerializer,
     PrimaryKeyRelatedField,
     ReadOnlyField,
+    Serializer,
     SerializerMethodField,
     ValidationError,
 )
 
 from api.fields import Base64ImageField, ColorNameConverter
+from recipes.documents import deferred_rebuild, rebuild_documents
 from recipes.models import (
     Favorite,
     Ingredient,
+    Job,
     Recipe,
     RecipeIngredient,
     Shopping_list,
     Tag,
 )
+from recipes.similarity import get_minhash
 from users.models import Subscription, User
 
 
+def get_sparse_fields(request, fields):
+    """Поля, оставшиеся после параметров запроса fields= и omit=."""
+    params = getattr(request, 'query_params', request.GET)
+    fields = set(fields)
+    if params.get('fields'):
+        fields &= set(params['fields'].split(','))
+    if params.get('omit'):
+        fields -= set(params['omit'].split(','))
+    return fields
+
+
+class SparseFieldsMixin:
+    """Убирает поля по fields= и omit= у сериализатора верхнего уровня.
+
+    Вложенные сериализаторы создаются без контекста и не меняются.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = kwargs.get('context', {}).get('request')
+        if request is None:
+            return
+        for name in set(self.fields) - get_sparse_fields(
+            request, self.fields
+        ):
+            self.fields.pop(name)
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
 
     class Meta:
@@ -33,7 +67,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -48,12 +82,16 @@ class CustomUserSerializer(UserSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
         request = self.context.get('request')
         return (
             request
             and request.user.is_authenticated
             and obj
-            and obj.subscriptions.filter(user=request.user).exists()
+            and Subscription.objects.filter(
+                user=request.user, author=obj
+            ).exists()
         )
 
 
@@ -67,6 +105,17 @@ class TagSerializer(ModelSerializer):
         fields = ("id", "name", "color_code", "slug")
 
 
+class JobSerializer(ModelSerializer):
+    """Сериализатор статуса фоновой задачи."""
+
+    class Meta:
+        model = Job
+        fields = (
+            "id", "name", "status", "attempts", "run_at", "result",
+            "error", "created_at", "updated_at"
+        )
+
+
 class IngredientSerializer(ModelSerializer):
     """Сериализатор просмотра модели Ингредиенты."""
     measurement_unit = CharField(validators=[
@@ -101,7 +150,7 @@ class RecipeIngredientCreateSerializer(ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, ModelSerializer):
     """ "Сериализатор для просмотра рецепта."""
 
     author = CustomUserSerializer(read_only=True)
@@ -127,13 +176,51 @@ class RecipeSerializer(ModelSerializer):
             "cooking_time",
         )
 
+    def to_representation(self, instance):
+        """Готовый документ рецепта плюс поля текущего пользователя.
+
+        Рецепты без документа (до пересборки) сериализуются обычным путём.
+        """
+        document = instance.document
+        if not document:
+            return super().to_representation(instance)
+        request = self.context.get('request')
+        data = {}
+        for name in self.fields:
+            if name == 'is_favorited':
+                data[name] = self.get_is_favorited(instance)
+            elif name == 'is_in_shopping_cart':
+                data[name] = self.get_is_in_shopping_cart(instance)
+            elif name == 'author':
+                data[name] = {
+                    **document[name],
+                    'is_subscribed': self.get_author_subscribed(instance),
+                }
+            elif name == 'image' and document[name] and request:
+                data[name] = request.build_absolute_uri(document[name])
+            else:
+                data[name] = document[name]
+        return data
+
+    def get_author_subscribed(self, obj):
+        if hasattr(obj, 'author_subscribed'):
+            return obj.author_subscribed
+        user = self.context.get('request').user
+        return user.is_authenticated and Subscription.objects.filter(
+            user=user, author_id=obj.author_id
+        ).exists()
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
         user = self.context.get('request').user
         return user.is_authenticated and Favorite.objects.filter(
             recipe=obj, user=user
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
         user = self.context.get('request').user
         return user.is_authenticated and Shopping_list.objects.filter(
             user=user, recipe=obj
@@ -175,14 +262,17 @@ class RecipeCreateSerializer(ModelSerializer):
     def validate_ingredients(self, value):
         if not value or len(value) < 1:
             raise ValidationError('Добавьте хотя бы один ингредиент')
+        return value
 
     def validate_tags(self, value):
         if not value or len(value) < 1:
             raise ValidationError('Добавьте хотя бы один тег')
+        return value
 
     def validate_cooking_time(self, value):
         if not isinstance(value, int) or value < 1:
             raise ValidationError('Время должно быть положительным')
+        return value
 
     def add_tags_ingredients(self, recipe, tags, ingredients):
         recipe.tags.set(tags)
@@ -193,26 +283,39 @@ class RecipeCreateSerializer(ModelSerializer):
                 amount=ingredient['amount']
             ) for ingredient in ingredients
         ])
+        # bulk_create не шлёт сигналов.
+        rebuild_documents([recipe.id])
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user, **validated_data
+        validated_data['minhash'] = get_minhash(
+            ingredient['id'] for ingredient in ingredients
         )
-        self.add_tags_ingredients(recipe, tags, ingredients)
+        with deferred_rebuild():
+            recipe = Recipe.objects.create(
+                author=self.context['request'].user, **validated_data
+            )
+            self.add_tags_ingredients(recipe, tags, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        RecipeIngredient.objects.filter(recipe=instance).delete()
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        self.add_tags_ingredients(
-            tags=tags, ingredients=ingredients, recipe=instance
+        validated_data['minhash'] = get_minhash(
+            ingredient['id'] for ingredient in ingredients
         )
-        return super().update(instance, validated_data)
+        with deferred_rebuild():
+            RecipeIngredient.objects.filter(recipe=instance).delete()
+            self.add_tags_ingredients(
+                tags=tags, ingredients=ingredients, recipe=instance
+            )
+            return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        instance.refresh_from_db(fields=['document'])
         return RecipeSerializer(instance, context=self.context).data
 
 
@@ -225,7 +328,7 @@ class RecipeFollowSerializer(ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class FollowSerializer(UserSerializer):
+class FollowSerializer(SparseFieldsMixin, UserSerializer):
     id = ReadOnlyField(source='author.id')
     email = ReadOnlyField(source='author.email')
     username = ReadOnlyField(source='author.username')
@@ -233,7 +336,7 @@ class FollowSerializer(UserSerializer):
     last_name = ReadOnlyField(source='author.last_name')
     is_subscribed = SerializerMethodField()
     recipes = SerializerMethodField()
-    recipes_count = ReadOnlyField(source='author.recipes.count')
+    recipes_count = SerializerMethodField()
 
     class Meta:
         model = Subscription
@@ -249,11 +352,26 @@ class FollowSerializer(UserSerializer):
     def get_recipes(self, obj):
         request = self.context.get('request')
         limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
+        queryset = Recipe.objects.filter(author=obj.author, is_deleted=False)
         if limit:
             queryset = queryset[:int(limit)]
         return RecipeFollowSerializer(queryset, many=True).data
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.author.recipes.filter(is_deleted=False).count()
+
+
+class RecipeMatchSerializer(Serializer):
+    """Сериализатор запроса подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = ListField(child=IntegerField(), allow_empty=False)
+    max_missing = IntegerField(min_value=0, required=False)
+    limit = IntegerField(
+        min_value=1, max_value=settings.MATCH_MAX_LIMIT, required=False
+    )
+
 
 class FavoriteSerializer(ModelSerializer):
     name = ReadOnlyField(source='recipe.name')
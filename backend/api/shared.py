@@ -0,0 +1,14 @@
+import mmap
+import os
+
+
+def open_shared(path, size):
+    """Открывает файл размером size и отображает его в память.
+
+    Отображение общее (MAP_SHARED), поэтому записи сразу видны всем
+    воркерам, открывшим тот же файл.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+    return fd, mmap.mmap(fd, size)
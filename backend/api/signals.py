@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+from .cache import api_cache
+
+# Кешируются только ответы анонимам, поэтому подписки на них не влияют;
+# теги рецепта меняются через m2m_changed.
+DEPENDENT_NAMESPACES = {
+    Recipe: ('recipes',),
+    RecipeIngredient: ('recipes',),
+    Tag: ('tags', 'recipes'),
+    Ingredient: ('ingredients', 'recipes'),
+    User: ('users', 'recipes'),
+}
+
+
+def bump_on_commit(*namespaces):
+    """Версия меняется после коммита, когда новые данные уже видны.
+
+    Иначе читатель успеет закешировать старые данные под новой версией.
+    """
+    transaction.on_commit(lambda: api_cache.bump(*namespaces))
+
+
+def bump_cache_version(sender, update_fields=None, **kwargs):
+    if sender is User and update_fields == frozenset(('last_login',)):
+        return
+    bump_on_commit(*DEPENDENT_NAMESPACES[sender])
+
+
+for model in DEPENDENT_NAMESPACES:
+    post_save.connect(bump_cache_version, sender=model)
+    post_delete.connect(bump_cache_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_on_commit('recipes')
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import CharField, Q, Value
+from django.utils import timezone as django_timezone
+
+from recipes.models import (
+    Deletion,
+    Favorite,
+    Ingredient,
+    Recipe,
+    Shopping_list,
+    Tag,
+)
+
+SYNC_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
+SNAPSHOT_KINDS = (
+    'tags', 'ingredients', 'recipes', 'favorites', 'shopping_cart'
+)
+
+
+def make_token(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def parse_token(token):
+    """Время из токена; ValueError, если токен испорчен."""
+    return datetime.fromtimestamp(int(token) / 1_000_000, tz=timezone.utc)
+
+
+def make_cursor(token, kind, last_id):
+    return f'{token}.{kind}.{last_id}'
+
+
+def parse_cursor(cursor):
+    """Токен снимка, тип и последний id; ValueError, если курсор испорчен."""
+    token, kind, last_id = cursor.split('.')
+    parse_token(token)
+    if kind not in SNAPSHOT_KINDS:
+        raise ValueError(kind)
+    return token, kind, int(last_id)
+
+
+def get_sources(user, since):
+    """Запросы изменений по типам; каждый — диапазон по индексу времени."""
+    sources = {
+        'recipes': Recipe.objects.filter(updated_at__gt=since),
+        'tags': Tag.objects.filter(updated_at__gt=since),
+        'ingredients': Ingredient.objects.filter(updated_at__gt=since),
+        'deleted': Deletion.objects.filter(deleted_at__gt=since).filter(
+            Q(user_id=None) | Q(user_id=user.id)
+        ),
+    }
+    if user.is_authenticated:
+        sources['favorites'] = Favorite.objects.filter(
+            user=user, created_at__gt=since
+        )
+        sources['shopping_cart'] = Shopping_list.objects.filter(
+            user=user, created_at__gt=since
+        )
+    return sources
+
+
+def get_changed_kinds(sources):
+    """Типы, в которых есть изменения, одним запросом UNION."""
+    queries = [
+        queryset.order_by().annotate(
+            source=Value(kind, output_field=CharField())
+        ).values_list('source', flat=True)
+        for kind, queryset in sources.items()
+    ]
+    return set(queries[0].union(*queries[1:]))
+
+
+def get_next_token():
+    """Токен для следующего запроса.
+
+    Сдвигается на SYNC_LAG назад, чтобы не потерять строки из
+    транзакций, которые ещё не закоммичены; клиент может получить
+    такие объекты повторно.
+    """
+    return make_token(django_timezone.now() - settings.SYNC_LAG)
+
+
+def get_snapshot_page(sources, kind, last_id):
+    """Страница полного снимка: не больше SYNC_PAGE_SIZE объектов.
+
+    Типы обходятся в порядке SNAPSHOT_KINDS, внутри типа — по id, так
+    что память не зависит от размера каталога. Возвращает запросы
+    страницы по типам и позицию (тип, id) следующей страницы или None.
+    """
+    kinds = [name for name in SNAPSHOT_KINDS if name in sources]
+    page = {}
+    left = settings.SYNC_PAGE_SIZE
+    for name in kinds[kinds.index(kind):]:
+        if not left:
+            return page, (name, last_id)
+        ids = list(
+            sources[name].filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', flat=True)[:left + 1]
+        )
+        if len(ids) > left:
+            page[name] = sources[name].filter(id__in=ids[:left])
+            return page, (name, ids[left - 1])
+        page[name] = sources[name].filter(id__in=ids)
+        left -= len(ids)
+        last_id = 0
+    return page, None
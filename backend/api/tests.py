@@ -0,0 +1,239 @@
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    OperationalError,
+    connection,
+    connections,
+    router,
+)
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch
+from rest_framework.test import APIClient
+
+from recipes.models import Deletion, Favorite, Recipe, Shopping_list
+from users.models import Subscription, User
+
+from .replicas import STICKY_COOKIE, ReplicaMiddleware, health
+
+THREADS = 8
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Параллельная запись проверяется только на PostgreSQL'
+)
+class ConcurrentCreateTests(TransactionTestCase):
+    """Одновременные запросы к одной связи: успешен ровно один."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='password',
+            first_name='Иван', last_name='Иванов'
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='password', first_name='Пётр', last_name='Петров'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', image='recipes/images/x.png',
+            text='Смешать и пожарить', cooking_time=20
+        )
+
+    def post_concurrently(self, url, method='post'):
+        barrier = threading.Barrier(THREADS)
+        statuses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_one_created(self, statuses):
+        self.assertEqual(statuses, [201] + [400] * (THREADS - 1))
+
+    def test_favorite(self):
+        self.assert_one_created(self.post_concurrently(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        ))
+        self.assertEqual(
+            Favorite.objects.filter(user=self.user).count(), 1
+        )
+
+    def test_shopping_cart(self):
+        self.assert_one_created(self.post_concurrently(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        ))
+        self.assertEqual(
+            Shopping_list.objects.filter(user=self.user).count(), 1
+        )
+
+    def test_delete_favorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.post_concurrently(url)
+        statuses = self.post_concurrently(url, 'delete')
+        self.assertEqual(statuses, [204] + [400] * (THREADS - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.trending_score, 0)
+        self.assertEqual(
+            Deletion.objects.filter(
+                kind='favorites', object_id=self.recipe.id
+            ).count(), 1
+        )
+
+    def test_subscribe(self):
+        self.assert_one_created(self.post_concurrently(
+            f'/api/users/{self.author.id}/subscribe/'
+        ))
+        self.assertEqual(
+            Subscription.objects.filter(user=self.user).count(), 1
+        )
+
+
+# Реплика-зеркало не видит данных из транзакции TestCase.
+@override_settings(DATABASE_REPLICAS=[])
+class RecipeFilterTests(TestCase):
+    """Фильтры списка рецептов."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='password', first_name='Пётр', last_name='Петров'
+        )
+        Recipe.objects.create(
+            author=self.author, name='Блины', image='recipes/images/x.png',
+            text='Смешать и пожарить', cooking_time=20
+        )
+
+    def test_anonymous_user_flags_filter_to_nothing(self):
+        for query in ('is_favorited=1', 'is_in_shopping_cart=1'):
+            with self.subTest(query):
+                response = self.client.get(
+                    f'/api/recipes/?{query}&anonymous={time.time()}'
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['count'], 0)
+        response = self.client.get(
+            f'/api/recipes/?is_favorited=0&anonymous={time.time()}'
+        )
+        self.assertEqual(response.json()['count'], 1)
+
+
+@skipUnless(
+    settings.DATABASE_REPLICAS,
+    'Нужна хотя бы одна реплика: задайте DB_REPLICA_HOSTS'
+)
+class ReplicaRoutingTests(TestCase):
+    """ReplicaRouter и ReplicaMiddleware на двух базах.
+
+    Реплика в тестах — зеркало основной базы (TEST MIRROR), поэтому
+    проверяется выбор базы, а не данные на ней. Фоновая проверка
+    реплик отключена, тесты вызывают health.check() сами.
+    """
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.replica = settings.DATABASE_REPLICAS[0]
+        patcher = mock.patch.object(health, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        health.healthy.clear()
+        health.check()
+
+    def handle(self, method='GET', path='/api/recipes/', write=False,
+               error=None, cookies=None):
+        """Базы чтения и ответ запроса, прошедшего через ReplicaMiddleware.
+
+        С error первое чтение с реплики падает этой ошибкой базы.
+        """
+        aliases = []
+
+        def view(request):
+            if write:
+                router.db_for_write(Recipe)
+            aliases.append(router.db_for_read(Recipe))
+            if error is not None and aliases[-1] != DEFAULT_DB_ALIAS:
+                raise error
+            return HttpResponse()
+
+        def get_response(request):
+            try:
+                return view(request)
+            except Exception as exception:
+                response = middleware.process_exception(request, exception)
+                if response is None:
+                    raise
+                return response
+
+        middleware = ReplicaMiddleware(get_response)
+        request = RequestFactory().generic(method, path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = ResolverMatch(view, (), {})
+        return aliases, middleware(request)
+
+    def test_safe_api_request_reads_from_replica(self):
+        self.assertTrue(health.is_healthy(self.replica))
+        self.assertEqual(self.handle()[0], [self.replica])
+        self.assertEqual(self.handle('POST')[0], [DEFAULT_DB_ALIAS])
+        self.assertEqual(self.handle(path='/admin/')[0], [DEFAULT_DB_ALIAS])
+        self.assertEqual(router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_api_request_queries_replica(self):
+        with CaptureQueriesContext(connections[self.replica]) as queries:
+            response = self.client.get(f'/api/tags/?replica={time.time()}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries.captured_queries)
+
+    def test_read_after_write_in_request_uses_default(self):
+        self.assertEqual(self.handle(write=True)[0], [DEFAULT_DB_ALIAS])
+
+    @override_settings(REPLICA_STICKY_SECONDS=1)
+    def test_sticky_after_write_expires(self):
+        _, response = self.handle('POST', write=True)
+        cookies = {STICKY_COOKIE: response.cookies[STICKY_COOKIE].value}
+        self.assertEqual(self.handle(cookies=cookies)[0], [DEFAULT_DB_ALIAS])
+        self.assertEqual(self.handle()[0], [self.replica])
+        time.sleep(1.1)
+        self.assertEqual(self.handle(cookies=cookies)[0], [self.replica])
+
+    def test_unhealthy_replica_is_skipped(self):
+        with override_settings(
+            DATABASE_REPLICAS=[self.replica, 'replica_down']
+        ):
+            health.check()
+            self.assertFalse(health.is_healthy('replica_down'))
+            for _ in range(10):
+                self.assertEqual(self.handle()[0], [self.replica])
+
+    def test_retries_on_default_when_replica_fails(self):
+        aliases, response = self.handle(
+            error=OperationalError('replica is gone')
+        )
+        self.assertEqual(aliases, [self.replica, DEFAULT_DB_ALIAS])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(health.is_healthy(self.replica))
+        self.assertEqual(self.handle()[0], [DEFAULT_DB_ALIAS])
+        health.check()
+        self.assertEqual(self.handle()[0], [self.replica])
@@ -0,0 +1,124 @@
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .shared import open_shared
+
+SLOT = struct.Struct('<Qdd')
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class TokenBucketStore:
+    """Корзины токенов в общем для всех воркеров файле, отображённом в память.
+
+    Ключ хешируется в один из slots слотов, слот блокируется через
+    fcntl только на время чтения и записи своих 24 байт. При коллизии
+    хешей корзина просто начинается заново.
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def open(self):
+        self.fd, self.mmap = open_shared(self.path, self.slots * SLOT.size)
+        self.pid = os.getpid()
+
+    def consume(self, key, capacity, period):
+        """Забирает токен; возвращает 0 или сколько секунд ждать."""
+        if self.pid != os.getpid():
+            self.open()
+        digest = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little'
+        )
+        offset = digest % self.slots * SLOT.size
+        refill = capacity / period
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                now = time.time()
+                fingerprint, tokens, updated = SLOT.unpack_from(
+                    self.mmap, offset
+                )
+                if fingerprint != digest:
+                    tokens, updated = capacity, now
+                tokens = min(capacity, tokens + (now - updated) * refill)
+                wait = 0 if tokens >= 1 else (1 - tokens) / refill
+                if not wait:
+                    tokens -= 1
+                SLOT.pack_into(self.mmap, offset, digest, tokens, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, SLOT.size, offset)
+        return wait
+
+
+bucket_store = TokenBucketStore(
+    settings.THROTTLE_STORE_PATH, settings.THROTTLE_SLOTS
+)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ограничение частоты по корзине токенов.
+
+    Частота берётся из DEFAULT_THROTTLE_RATES по ключу
+    '<scope>.<basename>.<action>', затем '<scope>'.
+    """
+
+    scope = None
+    rates = {}
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def get_rate(self, view):
+        basename = getattr(view, 'basename', None)
+        action = getattr(view, 'action', None)
+        rate_key = f'{self.scope}.{basename}.{action}'
+        if rate_key not in self.rates:
+            rates = api_settings.DEFAULT_THROTTLE_RATES
+            rate = rates.get(rate_key, rates.get(self.scope))
+            if rate is not None:
+                count, period = rate.split('/')
+                rate = int(count), PERIODS[period[0]]
+            self.rates[rate_key] = rate
+        return rate_key, self.rates[rate_key]
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        rate_key, rate = self.get_rate(view)
+        if rate is None:
+            return True
+        self.wait_time = bucket_store.consume(f'{rate_key}:{ident}', *rate)
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    scope = 'anon'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
@@ -1,11 +1,17 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework import routers
 
 from .views import (
     CustomUserViewSet,
     IngredientViewSet,
+    JobViewSet,
     RecipeViewSet,
     TagViewSet,
+    cache_stats,
+    profile_detail,
+    profile_flamegraph,
+    profile_list,
+    sync,
 )
 
 app_name = 'api'
@@ -15,8 +21,20 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('tags', TagViewSet, basename='tags')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('users', CustomUserViewSet, basename='users')
+router.register('jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
+    path('cache/stats/', cache_stats, name='cache-stats'),
+    path('profiles/', profile_list, name='profiles'),
+    path('sync/', sync, name='sync'),
+    re_path(
+        r'^profiles/(?P<profile_id>\d+-\d+)/$', profile_detail,
+        name='profile-detail'
+    ),
+    re_path(
+        r'^profiles/(?P<profile_id>\d+-\d+)/flamegraph/$',
+        profile_flamegraph, name='profile-flamegraph'
+    ),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken'))
 ]
@@ -1,70 +1,165 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import os
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Value
+from django.db.models.functions import Greatest
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser import utils
 from djoser.views import UserViewSet
 from rest_framework import status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from recipes.export import iter_ndjson, parse_since
+from recipes.index import ingredient_index
+from recipes.jobs import enqueue
 from recipes.models import (
     Favorite,
     Ingredient,
+    Job,
     Recipe,
-    RecipeIngredient,
     Shopping_list,
     Tag,
+    get_trending_weight,
+    lock_trending_epoch,
 )
+from recipes.similarity import get_minhash, similarity_index
 from users.models import Subscription, User
 
+from . import metrics
+from .cache import api_cache, cached_response
+from .cart import CART_FORMATS, get_cart_document, get_cart_fingerprint
 from .filters import RecipeFilter
 from .permissions import IsAuthorOrReadOnly
+from .profiling import profile_store
 from .serializers import (
     CustomUserSerializer,
     FavoriteSerializer,
     FollowSerializer,
     IngredientSerializer,
+    JobSerializer,
     RecipeCreateSerializer,
+    RecipeFollowSerializer,
+    RecipeMatchSerializer,
     RecipeSerializer,
     TagSerializer,
+    get_sparse_fields,
+)
+from .sync import (
+    SNAPSHOT_KINDS,
+    SYNC_START,
+    get_changed_kinds,
+    get_next_token,
+    get_snapshot_page,
+    get_sources,
+    make_cursor,
+    parse_cursor,
+    parse_token,
 )
 
 
+def prefetch_recipes(queryset, request):
+    """Рецепты с флагами пользователя только для полей из ответа.
+
+    Автор, теги и ингредиенты берутся из Recipe.document без запросов.
+    """
+    fields = get_sparse_fields(request, RecipeSerializer.Meta.fields)
+    user = request.user
+    queryset = queryset.defer('minhash', 'text')
+    if user.is_authenticated and 'is_favorited' in fields:
+        queryset = queryset.annotate(favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ))
+    if user.is_authenticated and 'is_in_shopping_cart' in fields:
+        queryset = queryset.annotate(in_shopping_cart=Exists(
+            Shopping_list.objects.filter(user=user, recipe=OuterRef('pk'))
+        ))
+    if user.is_authenticated and 'author' in fields:
+        queryset = queryset.annotate(author_subscribed=Exists(
+            Subscription.objects.filter(
+                user=user, author=OuterRef('author_id')
+            )
+        ))
+    return queryset
+
+
 class CustomUserViewSet(UserViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.filter(is_deleted=False)
     serializer_class = CustomUserSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if (
+            self.action in ('list', 'retrieve')
+            and user.is_authenticated
+            and 'is_subscribed' in get_sparse_fields(
+                self.request, CustomUserSerializer.Meta.fields
+            )
+        ):
+            queryset = queryset.annotate(subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return queryset
+
+    def perform_destroy(self, instance):
+        if instance == self.request.user:
+            utils.logout_user(self.request)
+        instance.soft_delete()
+
+    @cached_response('users', anonymous_only=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('users', anonymous_only=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(['POST', 'DELETE'], detail=True)
     def subscribe(self, request, **kwargs):
         user = request.user
-        author = get_object_or_404(User, id=kwargs.get('id'))
+        author_id = kwargs.get('id')
         if request.method == 'POST':
+            author = get_object_or_404(self.queryset, id=author_id)
             if user == author:
                 return Response(
                     {'errors': 'На себя подписаться нельзя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if Subscription.objects.filter(user=user, author=author).exists():
+            try:
+                with transaction.atomic():
+                    follow = Subscription.objects.create(
+                        user=user, author=author
+                    )
+            except IntegrityError:
                 return Response(
                     {'errors': 'Вы уже подписаны на этого автора'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            follow = Subscription.objects.create(
-                user=user, author=author
-            )
             serializer = FollowSerializer(
                 follow, context={'request': request}
             )
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
-        follow = Subscription.objects.filter(user=user, author=author)
-        if follow.exists():
-            follow.delete()
+        deleted, _ = Subscription.objects.filter(
+            user=user, author_id=author_id
+        ).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(self.queryset, id=author_id)
         return Response(
             {'errors': 'Вы не подписаны на этого автора'},
             status=status.HTTP_400_BAD_REQUEST
@@ -72,7 +167,16 @@ class CustomUserViewSet(UserViewSet):
 
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        queryset = Subscription.objects.filter(user=request.user)
+        queryset = Subscription.objects.filter(
+            user=request.user, author__is_deleted=False
+        ).select_related('author').order_by('id')
+        if 'recipes_count' in get_sparse_fields(
+            request, FollowSerializer.Meta.fields
+        ):
+            queryset = queryset.annotate(recipes_count=Count(
+                'author__recipes',
+                filter=Q(author__recipes__is_deleted=False)
+            ))
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages, many=True, context={'request': request}
@@ -87,15 +191,31 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     search_fields = ('^name',)
     pagination_class = None
 
+    @cached_response('ingredients')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('ingredients')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    @cached_response('tags')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('tags')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(ModelViewSet):
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.filter(is_deleted=False)
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
@@ -106,23 +226,136 @@ class RecipeViewSet(ModelViewSet):
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return prefetch_recipes(queryset, self.request)
+
+    def perform_destroy(self, instance):
+        instance.soft_delete()
+
+    @cached_response('recipes', anonymous_only=True)
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.list_by_ids(request.query_params['ids'])
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = self.get_facets(queryset)
+        return response
+
+    @cached_response('recipes', anonymous_only=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def list_by_ids(self, ids):
+        """Рецепты по списку id в порядке запроса, без пагинации."""
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in ids.split(',') if pk))
+        except ValueError:
+            return Response(
+                {'errors': 'ids должен быть списком чисел через запятую'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > settings.RECIPE_IDS_LIMIT:
+            return Response(
+                {'errors': f'Не больше {settings.RECIPE_IDS_LIMIT} id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipes = self.get_queryset().filter(id__in=ids).in_bulk()
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        )
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in recipes],
+        })
+
+    def get_facets(self, queryset):
+        """Счётчики по тегам и флагам пользователя одним запросом."""
+        user = self.request.user
+        if user.is_authenticated:
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+            is_in_shopping_cart = Exists(Shopping_list.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        else:
+            is_favorited = is_in_shopping_cart = Value(False)
+        groups = queryset.order_by().annotate(
+            favorited=is_favorited, in_shopping_cart=is_in_shopping_cart
+        ).values(
+            'tags_mask', 'favorited', 'in_shopping_cart'
+        ).annotate(count=Count('id'))
+        tag_ids = dict(
+            Tag.objects.exclude(bit=None).values_list('bit', 'id')
+        )
+        facets = {'tags': {}, 'is_favorited': 0, 'is_in_shopping_cart': 0}
+        for group in groups:
+            mask, count = group['tags_mask'], group['count']
+            bit = 0
+            while mask:
+                if mask & 1 and bit in tag_ids:
+                    facets['tags'][tag_ids[bit]] = (
+                        facets['tags'].get(tag_ids[bit], 0) + count
+                    )
+                mask >>= 1
+                bit += 1
+            facets['is_favorited'] += count if group['favorited'] else 0
+            facets['is_in_shopping_cart'] += (
+                count if group['in_shopping_cart'] else 0
+            )
+        return facets
+
     def add_favorites(self, model, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if model.objects.filter(user=request.user, recipe=recipe).exists():
+        recipe = get_object_or_404(self.queryset, id=pk)
+        try:
+            with transaction.atomic():
+                instance = model.objects.create(
+                    user=request.user, recipe=recipe
+                )
+                epoch = lock_trending_epoch()
+                Recipe.objects.filter(id=recipe.id).update(
+                    trending_score=F('trending_score')
+                    + get_trending_weight(instance.created_at, epoch)
+                )
+        except IntegrityError:
             return Response(
                 {'errors': 'Рецепт уже добавлен'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        instance = model.objects.create(user=request.user, recipe=recipe)
         serializer = FavoriteSerializer(
             instance, context={'request': request}
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_favorites(self, model, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if get_object_or_404(model, user=request.user, recipe=recipe).delete():
+        # Вес добавления вычитается из популярности, иначе повторные
+        # добавления и удаления накручивают рецепт. Строка блокируется
+        # до удаления, поэтому из двух параллельных запросов вес снимет
+        # только тот, который её удалил; запись в Deletion делает сигнал.
+        with transaction.atomic():
+            favorites = model.objects.filter(user=request.user, recipe_id=pk)
+            created_at = favorites.select_for_update().values_list(
+                'created_at', flat=True
+            ).first()
+            deleted, _ = favorites.delete()
+            if deleted:
+                epoch = lock_trending_epoch()
+                Recipe.objects.filter(id=pk).update(
+                    trending_score=Greatest(
+                        F('trending_score')
+                        - get_trending_weight(created_at, epoch),
+                        0.0
+                    )
+                )
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(self.queryset, id=pk)
         return Response(
             {'error': 'Этот рецепт еще не добавлен'},
             status=status.HTTP_400_BAD_REQUEST
@@ -144,24 +377,248 @@ class RecipeViewSet(ModelViewSet):
             return self.add_favorites(Shopping_list, request, kwargs.get('pk'))
         return self.delete_favorites(Shopping_list, request, kwargs.get('pk'))
 
+    @action(['POST'], detail=False)
+    def match(self, request):
+        serializer = RecipeMatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        matches = ingredient_index.match(**serializer.validated_data)
+        recipes = self.queryset.in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        return Response([
+            {
+                **RecipeFollowSerializer(
+                    recipes[recipe_id], context={'request': request}
+                ).data,
+                'coverage': coverage,
+                'missing': missing,
+            }
+            for recipe_id, coverage, missing in matches
+            if recipe_id in recipes
+        ])
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        signature = recipe.minhash or get_minhash(
+            recipe.ingredient_in_recipe.values_list(
+                'ingredient_id', flat=True
+            )
+        )
+        similar = similarity_index.similar(
+            recipe.id, bytes(signature), settings.SIMILAR_LIMIT
+        )
+        recipes = self.queryset.in_bulk(
+            [recipe_id for recipe_id, _ in similar]
+        )
+        return Response([
+            {
+                **RecipeFollowSerializer(
+                    recipes[recipe_id], context={'request': request}
+                ).data,
+                'similarity': similarity,
+            }
+            for recipe_id, similarity in similar
+            if recipe_id in recipes
+        ])
+
+    @action(detail=False, permission_classes=(IsAdminUser,))
+    def export(self, request):
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_since(since)
+            except ValueError as error:
+                return Response(
+                    {'errors': str(error)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        if request.query_params.get('async') in ('1', 'true'):
+            key = request.headers.get('Idempotency-Key')
+            job = enqueue(
+                'export_recipes',
+                {'since': since and since.isoformat(), 'compress': compress},
+                idempotency_key=key and f'{request.user.id}:{key}',
+                user=request.user
+            )
+            return Response(
+                JobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+            )
+        response = StreamingHttpResponse(
+            iter_ndjson(since or None, compress=compress),
+            content_type=(
+                'application/gzip' if compress else 'application/x-ndjson'
+            )
+        )
+        filename = 'recipes.ndjson.gz' if compress else 'recipes.ndjson'
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}"'
+        )
+        return response
+
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        ingredients = (RecipeIngredient.objects.filter(
-            recipe__shopping_recipe__user=request.user
-        ).values(
-            'ingredient'
-        ).order_by(
-            'ingredient__name'
-        ).annotate(
-            total_amount=Sum('amount')
-        ).values_list(
-            'ingredient__name', 'total_amount', 'ingredient__measurement_unit'
-        ))
-        shopping_cart = []
-        for ingredient in ingredients:
-            shopping_cart.append(
-                f'{ingredient[0]} ({ingredient[2]}) - {ingredient[1]}\n'
+        cart_format = request.query_params.get('type', 'txt')
+        if cart_format not in CART_FORMATS:
+            return Response(
+                {'errors': f'Доступные форматы: {", ".join(CART_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, filename = CART_FORMATS[cart_format]
+        fingerprint = get_cart_fingerprint(request.user)
+        etag = f'"{fingerprint}-{cart_format}"'
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in if_none_match.replace('W/', '').split(', '):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                get_cart_document(request.user, cart_format, fingerprint),
+                content_type=content_type
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="{filename}"'
             )
-        response = HttpResponse(shopping_cart, 'Content-Type: text/plain')
-        response['Content-Disposition'] = 'attachment; filename="shopping.txt"'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
+
+
+class JobViewSet(ReadOnlyModelViewSet):
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+
+@api_view(['GET'])
+def sync(request):
+    """Изменения каталога и списков пользователя с момента токена since.
+
+    Без since отдаётся полный снимок по страницам: пока в ответе есть
+    cursor, клиент запрашивает ?cursor=..., а после последней страницы
+    синхронизируется с since=token. Ответ содержит токен, изменённые
+    объекты и id удалённых в deleted.
+    """
+    token = request.query_params.get('since')
+    cursor = request.query_params.get('cursor')
+    position = None
+    if token:
+        next_token = get_next_token()
+        try:
+            since = parse_token(token)
+        except (ValueError, OverflowError, OSError):
+            return Response(
+                {'errors': 'Некорректный токен синхронизации'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if since < timezone.now() - settings.SYNC_TOMBSTONE_TTL:
+            return Response(
+                {'errors': 'Токен устарел, нужна полная синхронизация'},
+                status=status.HTTP_410_GONE
+            )
+        sources = get_sources(request.user, since)
+        changed = get_changed_kinds(sources)
+    else:
+        sources = get_sources(request.user, SYNC_START)
+        sources['recipes'] = sources['recipes'].filter(is_deleted=False)
+        try:
+            next_token, kind, last_id = parse_cursor(cursor) if cursor else (
+                get_next_token(), SNAPSHOT_KINDS[0], 0
+            )
+            page, position = get_snapshot_page(sources, kind, last_id)
+        except (ValueError, OverflowError, OSError):
+            return Response(
+                {'errors': 'Некорректный курсор синхронизации'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        sources.update(page)
+        changed = set(page)
+    data = {'token': next_token}
+    deleted = {}
+    if 'deleted' in changed:
+        for kind, object_id in sources['deleted'].values_list(
+            'kind', 'object_id'
+        ):
+            deleted.setdefault(kind, set()).add(object_id)
+    recipes = []
+    if 'recipes' in changed:
+        for recipe in prefetch_recipes(sources['recipes'], request):
+            if recipe.is_deleted:
+                deleted.setdefault('recipes', set()).add(recipe.id)
+            else:
+                recipes.append(recipe)
+    data['recipes'] = RecipeSerializer(
+        recipes, many=True, context={'request': request}
+    ).data
+    for kind, serializer in (
+        ('tags', TagSerializer), ('ingredients', IngredientSerializer)
+    ):
+        data[kind] = serializer(
+            sources[kind] if kind in changed else [], many=True
+        ).data
+    for kind in ('favorites', 'shopping_cart'):
+        if kind not in sources:
+            continue
+        data[kind] = list(
+            sources[kind].values_list('recipe_id', flat=True)
+        ) if kind in changed else []
+        deleted.get(kind, set()).difference_update(data[kind])
+    data['deleted'] = {
+        kind: sorted(object_ids) for kind, object_ids in deleted.items()
+        if object_ids
+    }
+    data['cursor'] = make_cursor(next_token, *position) if position else None
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response({'pid': os.getpid(), **api_cache.stats})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    profiles = []
+    for profile_id in profile_store.list():
+        try:
+            profile = profile_store.load(profile_id)
+        except FileNotFoundError:
+            continue
+        profile['sql'] = len(profile['sql'])
+        profiles.append(profile)
+    return Response(profiles)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, profile_id):
+    try:
+        return Response(profile_store.load(profile_id))
+    except FileNotFoundError:
+        raise Http404
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_flamegraph(request, profile_id):
+    try:
+        folded = open(profile_store.path(profile_id, 'folded'), 'rb')
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(
+        folded, as_attachment=True, filename=f'{profile_id}.folded',
+        content_type='text/plain; charset=utf-8'
+    )
+
+
+def metrics_view(request):
+    """Метрики всех воркеров для Prometheus; nginx этот путь не отдаёт."""
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4'
+    )
@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.events import recipe_events  # noqa: E402
+
+EVENTS_PATH = '/api/events/'
+
+
+async def application(scope, receive, send):
+    """Django-приложение плюс SSE-поток /api/events/ без Django-обработчика.
+
+    Долгие соединения живут в цикле событий и не занимают потоки.
+    """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            await send({'type': message['type'] + '.complete'})
+            if message['type'] == 'lifespan.shutdown':
+                return
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await recipe_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,65 @@
+"""Настройки gunicorn для продакшена: gunicorn -c python:foodgram.gunicorn."""
+import glob
+import multiprocessing
+import os
+
+# В контейнере с ограничением по CPU cpu_count() вернёт все ядра хоста.
+if hasattr(os, 'sched_getaffinity'):
+    CPUS = len(os.sched_getaffinity(0))
+else:
+    CPUS = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+preload_app = True
+workers = int(os.getenv('GUNICORN_WORKERS', CPUS * 2 + 1))
+# Класс не зависит от числа ядер: потоковая выгрузка рецептов и скачивание
+# файлов держат соединение, и sync-воркер всё это время был бы занят.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    from django.conf import settings
+
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        os.remove(path)
+
+
+def when_ready(server):
+    from django.db import DatabaseError
+
+    from foodgram.warmup import warm_imports, warm_index
+
+    warm_imports()
+    try:
+        warm_index()
+    except DatabaseError as error:
+        server.log.warning(
+            'Ingredient index is not prebuilt, workers will build it: %s',
+            error
+        )
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    from foodgram.warmup import warm_catalogs
+
+    connections.close_all()
+    try:
+        warm_catalogs()
+    except Exception as error:
+        server.log.warning(
+            'Worker %s started without warm catalogs: %s', worker.pid, error
+        )
+    finally:
+        connections.close_all()
+
+
+def child_exit(server, worker):
+    from api.metrics import store
+
+    store.merge(worker.pid)
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -39,11 +41,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,6 +90,22 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', 5432)
     }
 }
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433.
+# Имя базы и учётные данные те же, что у основной.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))
+):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'OPTIONS': {'connect_timeout': 2},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -97,10 +119,63 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
 
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.AnonTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.getenv('THROTTLE_USER_RATE', '600/min'),
+        'anon': os.getenv('THROTTLE_ANON_RATE', '300/min'),
+        'user.recipes.list': '120/min',
+        'anon.recipes.list': '60/min',
+        'anon.ingredients.list': '120/min',
+        'anon.recipes.match': '30/min',
+        'user.recipes.match': '60/min',
+    },
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'SEARCH_PARAM': 'name',
 }
 
+# Файлы, общие для всех воркеров одного сервера.
+SHARED_MEMORY_DIR = os.getenv(
+    'SHARED_MEMORY_DIR',
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+)
+THROTTLE_STORE_PATH = os.getenv(
+    'THROTTLE_STORE_PATH',
+    os.path.join(SHARED_MEMORY_DIR, 'foodgram-throttle')
+)
+THROTTLE_SLOTS = 65536
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(SHARED_MEMORY_DIR, 'foodgram-metrics')
+)
+METRICS_FILE_SIZE = 1024 * 1024
+PROFILE_DIR = os.getenv('PROFILE_DIR', BASE_DIR / 'data' / 'profiles')
+PROFILE_KEEP = 100
+PROFILE_INTERVAL = 0.005
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'TIMEOUT': 300,
+    }
+}
+CACHE_L1_MAX_ENTRIES = 1000
+CACHE_L1_TIMEOUT = 60
+CACHE_VERSIONS_PATH = os.getenv(
+    'CACHE_VERSIONS_PATH',
+    os.path.join(SHARED_MEMORY_DIR, 'foodgram-cache-versions')
+)
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',
@@ -156,9 +231,12 @@ AUTH_USER_MODEL = 'users.User'
 
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
+STATICFILES_STORAGE = 'foodgram.storage.CompressedManifestStaticFilesStorage'
+COMPRESSION_MIN_SIZE = 1024
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -167,3 +245,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MAX_LENGTH_100 = 100
 PATH_TO_FILES = "recipes/images/"
 MAX_LENGTH = 1000
+MAX_TAGS = 63
+INGREDIENT_INDEX_REFRESH = 1
+MATCH_LIMIT = 20
+MATCH_MAX_LIMIT = 100
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+SIMILAR_LIMIT = 10
+RECIPE_IDS_LIMIT = 100
+SYNC_LAG = timedelta(seconds=5)
+SYNC_TOMBSTONE_TTL = timedelta(days=30)
+SYNC_PAGE_SIZE = 500
+SSE_POLL_INTERVAL = 1
+SSE_HEARTBEAT = 15
+SSE_BACKLOG_LIMIT = 100
+SIMILARITY_INDEX_PATH = os.getenv(
+    'SIMILARITY_INDEX_PATH', BASE_DIR / 'data' / 'similarity.idx'
+)
+# Веса популярности удваиваются каждые TRENDING_HALF_LIFE от эпохи.
+# TRENDING_EPOCH — начальная эпоха; compact_trending сдвигает её к
+# текущему времени, чтобы float не переполнялся.
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+TRENDING_HALF_LIFE = timedelta(days=7)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MAX_ATTEMPTS = 5
+JOB_TIMEOUT = timedelta(minutes=30)
+JOB_BACKOFF_BASE = 10
+JOB_BACKOFF_MAX = 3600
+JOB_POLL_INTERVAL = 1
+# Периодические задачи, которые ставит run_worker.
+JOB_SCHEDULE = {
+    'purge_deleted': timedelta(hours=1),
+    'compact_trending': timedelta(days=1),
+}
+REPLICA_STICKY_SECONDS = 5
+REPLICA_HEALTH_INTERVAL = 10
+REPLICA_MAX_LAG = 5
@@ -0,0 +1,47 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ttf',
+)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешами в именах и заранее сжатыми копиями .gz и .br.
+
+    nginx отдаёт готовые копии через gzip_static, не сжимая файлы
+    на каждый запрос.
+    """
+
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        compressed = set()
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if (
+                not dry_run
+                and hashed_name
+                and not isinstance(processed, Exception)
+            ):
+                for path in {name, hashed_name} - compressed:
+                    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+                        self.compress(path)
+                        compressed.add(path)
+            yield name, hashed_name, processed
+
+    def compress(self, path):
+        with self.open(path) as source:
+            content = source.read()
+        with open(self.path(path) + '.gz', 'wb') as target:
+            target.write(gzip.compress(content, 9))
+        if brotli is not None:
+            with open(self.path(path) + '.br', 'wb') as target:
+                target.write(brotli.compress(content))
@@ -0,0 +1,76 @@
+"""Прогрев процесса перед приёмом запросов.
+
+warm_imports() не обращается к базе и вызывается в мастере gunicorn
+(preload_app), чтобы воркеры получали уже импортированный код и
+заполненные кеши URL через copy-on-write. warm_index() строит там же
+индекс ингредиентов для /api/recipes/match/. warm_catalogs() выполняется
+в каждом воркере и заполняет кеши списков тегов и ингредиентов.
+"""
+import importlib
+
+from django.db import connections
+from django.urls import get_resolver, resolve
+from rest_framework.test import APIRequestFactory
+
+MODULES = (
+    'api.serializers',
+    'api.views',
+    'api.filters',
+    'api.throttling',
+    'api.middleware',
+    'djoser.views',
+    'djoser.serializers',
+    'rest_framework.authtoken.views',
+    'PIL.Image',
+    'PIL.PngImagePlugin',
+    'PIL.JpegImagePlugin',
+    'webcolors',
+)
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/1/',
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/users/',
+    '/api/users/me/',
+    '/api/users/subscriptions/',
+    '/api/auth/token/login/',
+)
+CATALOGS = ('/api/tags/', '/api/ingredients/')
+
+
+def warm_imports():
+    for module in MODULES:
+        importlib.import_module(module)
+    get_resolver().reverse_dict
+    for path in PATHS:
+        resolve(path)
+
+
+def warm_index():
+    """Индекс строится до fork; соединение мастера воркерам не достаётся."""
+    from recipes.index import ingredient_index
+
+    try:
+        ingredient_index.build()
+    finally:
+        connections.close_all()
+
+
+def get_unthrottled_view(view):
+    """Та же вьюха без ограничения частоты.
+
+    Иначе прогрев каждого воркера тратил бы токены клиента 127.0.0.1.
+    """
+    initkwargs = {**view.initkwargs, 'throttle_classes': ()}
+    if hasattr(view, 'actions'):
+        return view.cls.as_view(view.actions, **initkwargs)
+    return view.cls.as_view(**initkwargs)
+
+
+def warm_catalogs():
+    factory = APIRequestFactory()
+    for path in CATALOGS:
+        match = resolve(path)
+        view = get_unthrottled_view(match.func)
+        view(factory.get(path), *match.args, **match.kwargs)
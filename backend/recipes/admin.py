@@ -1,8 +1,10 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from .models import (
     Favorite,
     Ingredient,
+    Job,
     Recipe,
     RecipeIngredient,
     Shopping_list,
@@ -23,11 +25,17 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("name", "author", "in_favorite")
-    list_filter = ['tags']
+    list_display = ("name", "author", "in_favorite", "is_deleted")
+    list_filter = ['is_deleted', 'tags']
     search_fields = ("name", "author__username")
     inlines = [RecipeIngredientInline]
 
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        queryset.update(is_deleted=True, updated_at=timezone.now())
+
     @admin.display(description='В избранном')
     def in_favorite(self, obj):
         return obj.favorite.all().count()
@@ -40,7 +48,7 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Favorite)
 class FavoritesAdmin(admin.ModelAdmin):
-    list_display = ("user", "recipe")
+    list_display = ("user", "recipe", "created_at")
 
 
 @admin.register(RecipeIngredient)
@@ -51,4 +59,10 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Shopping_list)
 class Shopping_list(admin.ModelAdmin):
-    list_display = ("user", "recipe")
+    list_display = ("user", "recipe", "created_at")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "run_at", "updated_at")
+    list_filter = ("status", "name")
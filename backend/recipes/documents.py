@@ -0,0 +1,132 @@
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import Recipe, RecipeIngredient
+
+CHUNK_SIZE = 500
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+_deferred = threading.local()
+
+
+def build_documents(recipes):
+    """Документы рецептов без полей, зависящих от пользователя.
+
+    Повторяют вывод RecipeSerializer без is_favorited,
+    is_in_shopping_cart и author.is_subscribed; картинка хранится
+    относительным URL. Теги и ингредиенты читаются двумя запросами.
+    """
+    ids = [recipe.id for recipe in recipes]
+    tags = {}
+    for link in Recipe.tags.through.objects.filter(
+        recipe_id__in=ids
+    ).select_related('tag').order_by('tag__name'):
+        tags.setdefault(link.recipe_id, []).append({
+            'id': link.tag.id,
+            'name': link.tag.name,
+            'color_code': link.tag.color_code,
+            'slug': link.tag.slug,
+        })
+    ingredients = {}
+    for item in RecipeIngredient.objects.filter(
+        recipe_id__in=ids
+    ).select_related('ingredient').order_by('id'):
+        ingredients.setdefault(item.recipe_id, []).append({
+            'id': item.ingredient.id,
+            'name': item.ingredient.name,
+            'amount': item.amount,
+            'measurement_unit': item.ingredient.measurement_unit,
+        })
+    return {
+        recipe.id: {
+            'id': recipe.id,
+            'tags': tags.get(recipe.id, []),
+            'author': {
+                'id': recipe.author.id,
+                **{
+                    field: getattr(recipe.author, field)
+                    for field in AUTHOR_FIELDS
+                },
+            },
+            'ingredients': ingredients.get(recipe.id, []),
+            'name': recipe.name,
+            'image': recipe.image.url if recipe.image else None,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+        for recipe in recipes
+    }
+
+
+def iter_documents(queryset, chunk_size=CHUNK_SIZE):
+    """Пары (рецепт, свежий документ) пачками по chunk_size."""
+    recipes = queryset.select_related('author').defer('minhash').order_by(
+        'id'
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(recipes, chunk_size))
+        if not chunk:
+            return
+        documents = build_documents(chunk)
+        for recipe in chunk:
+            yield recipe, documents[recipe.id]
+
+
+def rebuild_documents(recipe_ids, touch=False):
+    """Пересобирает документы рецептов в текущей транзакции.
+
+    touch=True сдвигает и updated_at: документ изменился без изменения
+    самого рецепта (переименование автора, тега, ингредиента), а
+    /api/sync/ отдаёт рецепты по updated_at. Внутри deferred_rebuild()
+    id только копятся, а пересборка выполняется при выходе из блока.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    pending = getattr(_deferred, 'ids', None)
+    if pending is not None:
+        for recipe_id in recipe_ids:
+            pending[recipe_id] = pending.get(recipe_id, False) or touch
+        return
+    fields = ['document', 'updated_at'] if touch else ['document']
+    now = timezone.now()
+    batch = []
+    for recipe, document in iter_documents(
+        Recipe.objects.filter(id__in=recipe_ids)
+    ):
+        recipe.document = document
+        recipe.updated_at = now
+        batch.append(recipe)
+        if len(batch) == CHUNK_SIZE:
+            Recipe.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        Recipe.objects.bulk_update(batch, fields)
+
+
+@contextmanager
+def deferred_rebuild():
+    """Одна пересборка на блок вместо пересборки на каждый сигнал.
+
+    Если блок завершился исключением, документы не пересобираются:
+    транзакция всё равно будет откачена.
+    """
+    if getattr(_deferred, 'ids', None) is not None:
+        yield
+        return
+    _deferred.ids = pending = {}
+    try:
+        yield
+    finally:
+        _deferred.ids = None
+    for touch in (False, True):
+        rebuild_documents(
+            [
+                recipe_id for recipe_id, touched in pending.items()
+                if touched == touch
+            ],
+            touch
+        )
@@ -0,0 +1,69 @@
+import json
+import zlib
+from datetime import datetime, time
+from itertools import islice
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .documents import build_documents
+from .models import Recipe
+
+CHUNK_SIZE = 2000
+
+
+def parse_since(value):
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f'Некорректная дата: {value}')
+        since = datetime.combine(date, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def iter_recipes(since=None, chunk_size=CHUNK_SIZE):
+    """Документы рецептов пачками по chunk_size с постоянной памятью.
+
+    Берутся готовые Recipe.document, так что форма рецепта та же, что
+    в API; документы, которых ещё нет, собираются build_documents.
+    since отбирает рецепты, изменённые после этого момента.
+    """
+    queryset = Recipe.objects.filter(is_deleted=False).only(
+        'id', 'pub_date', 'updated_at', 'document'
+    ).order_by('id')
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    recipes = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(recipes, chunk_size))
+        if not chunk:
+            return
+        missing = build_documents(list(
+            Recipe.objects.filter(
+                id__in=[recipe.id for recipe in chunk if not recipe.document]
+            ).select_related('author')
+        ))
+        for recipe in chunk:
+            yield {
+                **(recipe.document or missing[recipe.id]),
+                'pub_date': recipe.pub_date.isoformat(),
+                'updated_at': recipe.updated_at.isoformat(),
+            }
+
+
+def iter_ndjson(since=None, chunk_size=CHUNK_SIZE, compress=False):
+    """Строки NDJSON в байтах, при compress=True — поток gzip."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    for document in iter_recipes(since, chunk_size):
+        line = json.dumps(document, ensure_ascii=False).encode() + b'\n'
+        if compressor is None:
+            yield line
+            continue
+        data = compressor.compress(line)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
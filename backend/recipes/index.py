@@ -0,0 +1,171 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Deletion, Recipe, RecipeIngredient
+
+# postings: ингредиент -> отсортированный array id рецептов;
+# sizes: число ингредиентов рецепта по его id.
+Snapshot = namedtuple('Snapshot', ('postings', 'sizes'))
+
+
+def set_size(sizes, recipe_id, size):
+    if recipe_id >= len(sizes):
+        sizes.frombytes(bytes(sizes.itemsize * (recipe_id + 1 - len(sizes))))
+    sizes[recipe_id] = size
+
+
+class IngredientIndex:
+    """Инвертированный индекс ингредиент -> отсортированные id рецептов.
+
+    Индекс строится один раз: в мастере gunicorn до fork, чтобы воркеры
+    получили его готовым, или при первом поиске. Дальше он обновляется
+    по рецептам, изменённым после прошлой проверки (updated_at с
+    перекрытием SYNC_LAG и удаления из Deletion), не чаще раза в
+    INGREDIENT_INDEX_REFRESH секунд; изменения своего процесса,
+    помеченные invalidate(), применяются к следующему поиску.
+
+    Поиск считает по неизменяемому снимку без блокировки: обновление
+    копирует только изменённые списки и подменяет ссылку на снимок.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.snapshot = None
+        self.ingredients = {}
+        self.dirty = set()
+        self.cursor = None
+        self.refreshed_at = None
+        self.refreshing = False
+
+    def invalidate(self, recipe_id):
+        with self.lock:
+            self.dirty.add(recipe_id)
+
+    def load(self):
+        postings = {}
+        sizes = array('H')
+        ingredients = {}
+        rows = RecipeIngredient.objects.filter(
+            recipe__is_deleted=False
+        ).order_by('ingredient_id', 'recipe_id').values_list(
+            'ingredient_id', 'recipe_id'
+        )
+        for ingredient_id, recipe_id in rows.iterator(chunk_size=10000):
+            postings.setdefault(ingredient_id, array('q')).append(recipe_id)
+            ingredients.setdefault(recipe_id, []).append(ingredient_id)
+        for recipe_id, items in ingredients.items():
+            ingredients[recipe_id] = tuple(items)
+            set_size(sizes, recipe_id, len(items))
+        return Snapshot(postings, sizes), ingredients
+
+    def build(self):
+        cursor = timezone.now() - settings.SYNC_LAG
+        snapshot, ingredients = self.load()
+        with self.lock:
+            self.snapshot, self.ingredients = snapshot, ingredients
+            self.cursor = cursor
+            self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        if self.snapshot is None:
+            with self.build_lock:
+                if self.snapshot is None:
+                    self.build()
+            return
+        with self.lock:
+            due = time.monotonic() - self.refreshed_at >= (
+                settings.INGREDIENT_INDEX_REFRESH
+            )
+            if self.refreshing or not (due or self.dirty):
+                return
+            self.refreshing = True
+            dirty, self.dirty = self.dirty, set()
+            cursor = self.cursor
+        try:
+            changed = set(dirty)
+            if due:
+                next_cursor = timezone.now() - settings.SYNC_LAG
+                changed.update(Recipe.objects.filter(
+                    updated_at__gt=cursor
+                ).values_list('id', flat=True))
+                changed.update(Deletion.objects.filter(
+                    kind='recipes', deleted_at__gt=cursor
+                ).values_list('object_id', flat=True))
+            recipes = {recipe_id: [] for recipe_id in changed}
+            for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=changed, recipe__is_deleted=False
+            ).values_list('recipe_id', 'ingredient_id'):
+                recipes[recipe_id].append(ingredient_id)
+            snapshot = self.apply(recipes)
+        except Exception:
+            with self.lock:
+                self.dirty |= dirty
+                self.refreshing = False
+            raise
+        with self.lock:
+            self.snapshot = snapshot
+            if due:
+                self.cursor = next_cursor
+                self.refreshed_at = time.monotonic()
+            self.refreshing = False
+
+    def apply(self, recipes):
+        """Новый снимок с пересчитанными рецептами; старый не меняется."""
+        postings = dict(self.snapshot.postings)
+        sizes = array('H', self.snapshot.sizes)
+        copied = set()
+
+        def get_posting(ingredient_id):
+            if ingredient_id not in copied:
+                copied.add(ingredient_id)
+                postings[ingredient_id] = array(
+                    'q', postings.get(ingredient_id, ())
+                )
+            return postings[ingredient_id]
+
+        for recipe_id, ingredients in recipes.items():
+            for ingredient_id in self.ingredients.pop(recipe_id, ()):
+                posting = get_posting(ingredient_id)
+                position = bisect_left(posting, recipe_id)
+                if position < len(posting) and posting[position] == recipe_id:
+                    del posting[position]
+            set_size(sizes, recipe_id, len(ingredients))
+            if not ingredients:
+                continue
+            self.ingredients[recipe_id] = tuple(ingredients)
+            for ingredient_id in ingredients:
+                insort(get_posting(ingredient_id), recipe_id)
+        return Snapshot(postings, sizes)
+
+    def match(self, ingredients, max_missing=None, limit=None):
+        """Рецепты по доле имеющихся ингредиентов: (id, покрытие, нехватка)."""
+        self.refresh()
+        with self.lock:
+            snapshot = self.snapshot
+        hits = {}
+        for ingredient_id in set(ingredients):
+            for recipe_id in snapshot.postings.get(ingredient_id, ()):
+                hits[recipe_id] = hits.get(recipe_id, 0) + 1
+        matches = []
+        for recipe_id, count in hits.items():
+            missing = snapshot.sizes[recipe_id] - count
+            if max_missing is None or missing <= max_missing:
+                matches.append(
+                    (count / (count + missing), -missing, recipe_id)
+                )
+        best = heapq.nlargest(limit or settings.MATCH_LIMIT, matches)
+        return [
+            (recipe_id, coverage, -missing)
+            for coverage, missing, recipe_id in best
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,155 @@
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрирует функцию как задачу очереди.
+
+    Функция получает job_id и аргументы из payload, а её результат
+    сохраняется в Job.result и должен сериализоваться в JSON.
+    """
+
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, idempotency_key=None, user=None,
+            run_at=None):
+    """Ставит задачу в очередь.
+
+    Повторный вызов с тем же idempotency_key возвращает уже созданную
+    задачу, а не новую.
+    """
+    if name not in TASKS:
+        raise ValueError(f'Неизвестная задача: {name}')
+    job = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        user=user,
+        run_at=run_at or timezone.now(),
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    if idempotency_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=idempotency_key)
+    return job
+
+
+def get_ready_jobs(now):
+    """Задачи в очереди и задачи упавших воркеров с истёкшей блокировкой."""
+    return Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim_jobs(limit):
+    """Забирает до limit готовых задач и возвращает их id.
+
+    На PostgreSQL строки выбираются SELECT ... FOR UPDATE SKIP LOCKED,
+    поэтому воркеры не ждут друг друга. SQLite такого не умеет, там
+    задача забирается условным UPDATE и достаётся тому, кто обновил
+    строку первым.
+    """
+    now = timezone.now()
+    claimed = {
+        'status': Job.RUNNING,
+        'locked_until': now + settings.JOB_TIMEOUT,
+        'attempts': F('attempts') + 1,
+        'updated_at': now,
+    }
+    ready = get_ready_jobs(now).order_by('run_at')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                ready.select_for_update(skip_locked=True).values_list(
+                    'id', flat=True
+                )[:limit]
+            )
+            Job.objects.filter(id__in=ids).update(**claimed)
+        return ids
+    return [
+        job_id
+        for job_id in ready.values_list('id', flat=True)[:limit]
+        if get_ready_jobs(now).filter(id=job_id).update(**claimed)
+    ]
+
+
+def get_backoff(attempts):
+    """Задержка перед повтором: экспонента от числа попыток с джиттером."""
+    delay = min(
+        settings.JOB_BACKOFF_MAX,
+        settings.JOB_BACKOFF_BASE * 2 ** (attempts - 1)
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def get_retry(attempts, max_attempts):
+    """Повтор с задержкой, пока не исчерпаны попытки, затем FAILED."""
+    if attempts >= max_attempts:
+        return {'status': Job.FAILED}
+    return {
+        'status': Job.QUEUED,
+        'run_at': timezone.now() + timedelta(seconds=get_backoff(attempts)),
+    }
+
+
+def fail_job(job_id, error):
+    """Снимает с воркера задачу, которая не вернула результат.
+
+    Нужна, когда упал сам процесс пула или база в run_job: иначе
+    задача до JOB_TIMEOUT висит в RUNNING.
+    """
+    attempts, max_attempts = Job.objects.values_list(
+        'attempts', 'max_attempts'
+    ).get(id=job_id)
+    update = get_retry(attempts, max_attempts)
+    Job.objects.filter(id=job_id, status=Job.RUNNING).update(
+        locked_until=None, updated_at=timezone.now(), error=error, **update
+    )
+    return update['status']
+
+
+def schedule_jobs(now):
+    """Ставит задачи JOB_SCHEDULE, по одной на каждый интервал.
+
+    Ключ идемпотентности — номер интервала, поэтому несколько воркеров
+    не ставят одну и ту же задачу дважды.
+    """
+    for name, interval in settings.JOB_SCHEDULE.items():
+        slot = int(now.timestamp() // interval.total_seconds())
+        enqueue(name, idempotency_key=f'schedule:{name}:{slot}')
+
+
+def run_job(job_id):
+    """Выполняет задачу; вызывается в процессе пула воркера."""
+    job = Job.objects.get(id=job_id)
+    try:
+        result = TASKS[job.name](job_id, **job.payload)
+    except Exception:
+        update = get_retry(job.attempts, job.max_attempts)
+        update['error'] = traceback.format_exc()
+    else:
+        update = {'status': Job.DONE, 'result': result, 'error': ''}
+    Job.objects.filter(id=job_id).update(
+        locked_until=None, updated_at=timezone.now(), **update
+    )
+    return job_id, update['status']
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import metrics
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of recording metrics for one request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=100000,
+            help='Requests recorded'
+        )
+
+    def handle(self, *args, **options):
+        queries = metrics.QueryTimer()
+        queries.count, queries.duration = 7, 0.004
+        routes = ['api:recipes-list', 'api:recipes-detail', 'api:tags-list']
+        iterations = options['iterations']
+        started = time.perf_counter()
+        for number in range(iterations):
+            metrics.record_request(
+                routes[number % len(routes)], 'GET', 200,
+                number % 300 / 1000, queries
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{elapsed / iterations * 1e6:.2f} µs per request '
+            f'({iterations} requests)'
+        )
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.models import User
+
+VARIANTS = (
+    ('full', '/api/recipes/'),
+    ('grid', '/api/recipes/?fields=id,name,image,cooking_time'),
+    ('no author', '/api/recipes/?omit=author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare payload and latency of full and sparse recipe lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=20, help='Requests per variant'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=50, help='Recipes per page'
+        )
+        parser.add_argument(
+            '--user', help='Email of the user the requests are made as'
+        )
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        user = options['user'] and User.objects.get(email=options['user'])
+        for title, path in VARIANTS:
+            path += ('&' if '?' in path else '?') + f'limit={options["limit"]}'
+            match = resolve(path.split('?')[0])
+            timings = []
+            for _ in range(options['runs']):
+                request = factory.get(path)
+                if user:
+                    force_authenticate(request, user)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = match.func(request, *match.args, **match.kwargs)
+                    response.render()
+                    timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{title}: {len(response.content)} bytes, '
+                f'{len(queries)} queries, '
+                f'{statistics.median(timings) * 1000:.1f} ms'
+            )
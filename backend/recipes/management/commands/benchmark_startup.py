@@ -0,0 +1,67 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.db import connections
+from django.test import Client
+from foodgram import warmup
+if sys.argv[1] == 'warm':
+    warmup.warm_imports()
+    connections.close_all()
+    warmup.warm_catalogs()
+ready = time.perf_counter()
+response = Client().get(sys.argv[2], HTTP_HOST='localhost')
+done = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'ready': ready - started,
+    'first_request': done - ready,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Compare worker startup and first request with and without warmup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='Processes started for each mode'
+        )
+        parser.add_argument(
+            '--path', default='/api/recipes/',
+            help='URL requested right after startup'
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'foodgram.settings'
+        ))
+        for mode in ('cold', 'warm'):
+            results = []
+            for _ in range(options['runs']):
+                output = subprocess.run(
+                    [sys.executable, '-c', PROBE, mode, options['path']],
+                    env=env, cwd=settings.BASE_DIR, check=True,
+                    capture_output=True, text=True
+                ).stdout
+                results.append(json.loads(output.splitlines()[-1]))
+            ready = statistics.median(item['ready'] for item in results)
+            first = statistics.median(
+                item['first_request'] for item in results
+            )
+            self.stdout.write(
+                f'{mode}: ready in {ready * 1000:.1f} ms, '
+                f'first request {first * 1000:.1f} ms '
+                f'(median of {len(results)})'
+            )
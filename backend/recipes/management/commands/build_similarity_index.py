@@ -0,0 +1,63 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes.models import Recipe, RecipeIngredient
+from recipes.similarity import get_minhash, write_index
+
+CHUNK_SIZE = 2000
+
+
+def get_signatures(chunk):
+    return [
+        (recipe_id, get_minhash(ingredient_ids))
+        for recipe_id, ingredient_ids in chunk
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Recompute MinHash signatures and rebuild the LSH index file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of processes computing signatures'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = RecipeIngredient.objects.filter(
+            recipe__is_deleted=False
+        ).order_by('recipe_id').values_list('recipe_id', 'ingredient_id')
+        recipes = [
+            (recipe_id, [ingredient_id for _, ingredient_id in group])
+            for recipe_id, group in groupby(
+                rows.iterator(chunk_size=CHUNK_SIZE), key=lambda row: row[0]
+            )
+        ]
+        chunks = [
+            recipes[start:start + CHUNK_SIZE]
+            for start in range(0, len(recipes), CHUNK_SIZE)
+        ]
+        connections.close_all()
+        signatures = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for chunk in pool.map(get_signatures, chunks):
+                Recipe.objects.bulk_update(
+                    [
+                        Recipe(id=recipe_id, minhash=signature)
+                        for recipe_id, signature in chunk
+                    ],
+                    ['minhash']
+                )
+                signatures.extend(chunk)
+        write_index(settings.SIMILARITY_INDEX_PATH, signatures)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(signatures)} recipes '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
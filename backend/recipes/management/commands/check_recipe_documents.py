@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.documents import iter_documents, rebuild_documents
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Compare stored recipe documents with freshly built ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Rebuild stale documents instead of failing'
+        )
+
+    def handle(self, *args, **options):
+        checked = 0
+        stale = []
+        for recipe, document in iter_documents(Recipe.objects.all()):
+            checked += 1
+            if recipe.document != document:
+                stale.append(recipe.id)
+                self.stdout.write(f'Stale document: recipe {recipe.id}')
+        self.stdout.write(f'Documents checked: {checked}')
+        if not stale:
+            self.stdout.write(self.style.SUCCESS('All documents are fresh'))
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'{len(stale)} stale documents, run with --fix'
+            )
+        with transaction.atomic():
+            rebuild_documents(stale)
+        self.stdout.write(
+            self.style.SUCCESS(f'Documents rebuilt: {len(stale)}')
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import (
+    Recipe,
+    TrendingEpoch,
+    get_trending_weight,
+    lock_trending_epoch,
+)
+
+
+class Command(BaseCommand):
+    help = 'Move the trending epoch to now and rescale scores in one UPDATE'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            epoch = lock_trending_epoch(exclusive=True)
+            now = timezone.now()
+            # Веса от новой эпохи меньше прежних ровно в этот множитель.
+            factor = 1 / get_trending_weight(now, epoch)
+            updated = Recipe.objects.filter(trending_score__gt=0).update(
+                trending_score=F('trending_score') * factor
+            )
+            TrendingEpoch.objects.update_or_create(
+                id=1, defaults={'started_at': now}
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Trending scores of {updated} recipes rescaled by {factor:.3g}'
+        ))
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.export import CHUNK_SIZE, iter_ndjson, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Stream the recipe catalog as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', help='File to write to, stdout by default'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Compress the output'
+        )
+        parser.add_argument(
+            '--since', help='Export recipes changed since this ISO time'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Recipes fetched per database round trip'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError as error:
+                raise CommandError(error)
+        lines = iter_ndjson(
+            since, options['chunk_size'], compress=options['gzip']
+        )
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            output = sys.stdout.buffer
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,227 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from PIL import Image
+
+from recipes.documents import rebuild_documents
+from recipes.models import (
+    ImportProgress,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Tag,
+    get_bits_mask,
+)
+from recipes.signals import delete_unused_image
+from recipes.similarity import get_minhash
+from users.models import User
+
+BATCH_SIZE = 500
+
+
+def load_image(path):
+    """Читает и проверяет картинку; выполняется в пуле процессов."""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with open(path, 'rb') as image_file:
+            return image_file.read(), None
+    except (OSError, SyntaxError) as error:
+        return None, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Bulk import recipes from an NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file with recipes')
+        parser.add_argument(
+            '--images-dir', default='.',
+            help='Directory that relative image paths are resolved against'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Recipes written per transaction'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of processes reading images'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Name of the progress record, the absolute path by default'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore saved progress and import from the first line'
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError(f'File {options["path"]} does not exist')
+        self.checkpoint = options['checkpoint'] or os.path.abspath(
+            options['path']
+        )
+        progress, _ = ImportProgress.objects.get_or_create(
+            source=self.checkpoint
+        )
+        done = 0 if options['restart'] else progress.lines
+        if done:
+            self.stdout.write(f'Resuming after line {done}')
+        self.images_dir = options['images_dir']
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.users.update(User.objects.values_list('email', 'id'))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.tag_bits = dict(Tag.objects.values_list('id', 'bit'))
+        self.ingredients = {
+            (name, unit): ingredient_id
+            for ingredient_id, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        }
+        self.ingredient_ids = set(self.ingredients.values())
+        connections.close_all()
+        started = time.monotonic()
+        imported = skipped = 0
+        with open(options['path']) as source, ProcessPoolExecutor(
+            max_workers=options['workers']
+        ) as pool:
+            lines = islice(source, done, None)
+            while True:
+                batch = list(islice(lines, options['batch_size']))
+                if not batch:
+                    break
+                created, errors = self.import_batch(done, batch, pool)
+                done += len(batch)
+                imported += created
+                skipped += len(errors)
+                for error in errors:
+                    self.stderr.write(error)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{done} lines, {imported} imported, {skipped} skipped, '
+                    f'{imported / elapsed:.0f} recipes/s'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
+
+    def import_batch(self, offset, lines, pool):
+        errors = []
+        parsed = []
+        for number, line in enumerate(lines, offset + 1):
+            if not line.strip():
+                continue
+            try:
+                parsed.append((number, self.parse(json.loads(line))))
+            except (ValueError, KeyError, TypeError) as error:
+                errors.append(f'Line {number}: {error!r}')
+        images = pool.map(
+            load_image, [data['image'] for _, data in parsed]
+        )
+        loaded = []
+        for (number, data), (content, error) in zip(parsed, images):
+            if error:
+                errors.append(f'Line {number}: {error}')
+            else:
+                loaded.append((data, content))
+        storage = Recipe._meta.get_field('image').storage
+        names = []
+        try:
+            with transaction.atomic():
+                self.save_batch(loaded, names)
+                ImportProgress.objects.filter(source=self.checkpoint).update(
+                    lines=offset + len(lines)
+                )
+        except BaseException:
+            # Файлы пишутся до коммита: после отката удаляем те, на
+            # которые так и не сослался ни один рецепт.
+            for name in names:
+                delete_unused_image(storage, name)
+            raise
+        return len(loaded), errors
+
+    def save_batch(self, loaded, names):
+        recipes, tags, ingredients = [], [], []
+        for data, content in loaded:
+            recipe = Recipe(
+                author_id=data['author_id'],
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                tags_mask=get_bits_mask(
+                    self.tag_bits[tag_id] for tag_id in data['tags']
+                ),
+                minhash=get_minhash(data['ingredients']),
+            )
+            recipe.image.save(
+                os.path.basename(data['image']),
+                ContentFile(content),
+                save=False
+            )
+            names.append(recipe.image.name)
+            recipes.append(recipe)
+            tags.append(data['tags'])
+            ingredients.append(data['ingredients'])
+        Recipe.objects.bulk_create(recipes)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, tag_ids in zip(recipes, tags)
+            for tag_id in tag_ids
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe_id=recipe.id, ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for recipe, amounts in zip(recipes, ingredients)
+            for ingredient_id, amount in amounts.items()
+        ])
+        rebuild_documents(recipe.id for recipe in recipes)
+
+    def parse(self, data):
+        author = data['author']
+        if isinstance(author, dict):
+            author = author.get('username') or author['email']
+        tags = [
+            tag['slug'] if isinstance(tag, dict) else tag
+            for tag in data['tags']
+        ]
+        ingredients = {}
+        for item in data['ingredients']:
+            if 'id' in item and item['id'] in self.ingredient_ids:
+                ingredient_id = item['id']
+            else:
+                ingredient_id = self.ingredients[
+                    (item['name'], item['measurement_unit'])
+                ]
+            ingredients[ingredient_id] = int(item['amount'])
+        cooking_time = int(data['cooking_time'])
+        if cooking_time < 1 or not ingredients or not tags:
+            raise ValueError('Рецепт без ингредиентов, тегов или времени')
+        image = urlparse(data['image'])
+        if image.scheme not in ('', 'file'):
+            raise ValueError(f'Картинка должна быть локальной: {image}')
+        # Экспорт пишет URL вида /media/recipes/...; --images-dir
+        # тогда указывает на MEDIA_ROOT исходной базы.
+        image_path = image.path
+        if image_path.startswith(settings.MEDIA_URL):
+            image_path = image_path[len(settings.MEDIA_URL):]
+        return {
+            'author_id': self.users[author],
+            'name': data['name'][:settings.MAX_LENGTH],
+            'text': data['text'],
+            'cooking_time': cooking_time,
+            'tags': [self.tags[slug] for slug in tags],
+            'ingredients': ingredients,
+            'image': os.path.join(self.images_dir, image_path),
+        }
@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.index import ingredient_index
+from recipes.models import (
+    Deletion,
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    Shopping_list,
+    raw_delete,
+)
+from recipes.signals import DELETION_KINDS, delete_unused_image
+from users.models import Subscription, User
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Purge soft-deleted recipes and users in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of rows deleted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        recipes = self.purge(
+            Recipe.objects.filter(is_deleted=True), batch_size
+        )
+        self.stdout.write(f'Recipes purged: {recipes}')
+        users = 0
+        for user_id in User.objects.filter(
+            is_deleted=True
+        ).values_list('id', flat=True).iterator():
+            for queryset in (
+                Recipe.objects.filter(author_id=user_id),
+                Favorite.objects.filter(user_id=user_id),
+                Shopping_list.objects.filter(user_id=user_id),
+                Subscription.objects.filter(user_id=user_id),
+                Subscription.objects.filter(author_id=user_id),
+            ):
+                self.purge(queryset, batch_size)
+            User.objects.filter(id=user_id).delete()
+            users += 1
+        self.stdout.write(f'Users purged: {users}')
+        tombstones = self.purge(Deletion.objects.filter(
+            deleted_at__lt=timezone.now() - settings.SYNC_TOMBSTONE_TTL
+        ), batch_size)
+        self.stdout.write(f'Sync tombstones purged: {tombstones}')
+        self.stdout.write(self.style.SUCCESS('Purge finished'))
+
+    def purge(self, queryset, batch_size):
+        """Удаляет строки пачками, чтобы не держать длинную транзакцию.
+
+        Удаление идёт простыми DELETE без Collector и сигналов: их
+        побочные эффекты для рецептов выполняет delete_recipes.
+        """
+        model = queryset.model
+        total = 0
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total
+            with transaction.atomic():
+                if model is Recipe:
+                    self.delete_recipes(ids)
+                else:
+                    raw_delete(model.objects.filter(id__in=ids))
+            total += len(ids)
+
+    def delete_recipes(self, ids):
+        images = set(Recipe.objects.filter(id__in=ids).exclude(
+            image=''
+        ).values_list('image', flat=True))
+        tombstones = [
+            Deletion(kind=DELETION_KINDS[Recipe], object_id=recipe_id)
+            for recipe_id in ids
+        ]
+        for model in (Favorite, Shopping_list):
+            tombstones.extend(
+                Deletion(
+                    kind=DELETION_KINDS[model], object_id=recipe_id,
+                    user_id=user_id
+                )
+                for user_id, recipe_id in model.objects.filter(
+                    recipe_id__in=ids
+                ).values_list('user_id', 'recipe_id')
+            )
+        for queryset in (
+            RecipeIngredient.objects.filter(recipe_id__in=ids),
+            Recipe.tags.through.objects.filter(recipe_id__in=ids),
+            Favorite.objects.filter(recipe_id__in=ids),
+            Shopping_list.objects.filter(recipe_id__in=ids),
+            Recipe.objects.filter(id__in=ids),
+        ):
+            raw_delete(queryset)
+        Deletion.objects.bulk_create(tombstones)
+
+        def invalidate():
+            for recipe_id in ids:
+                ingredient_index.invalidate(recipe_id)
+        transaction.on_commit(invalidate)
+        storage = Recipe._meta.get_field('image').storage
+        for name in images:
+            delete_unused_image(storage, name)
@@ -0,0 +1,35 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.documents import rebuild_documents
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Move recipe images to content-addressed names'
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct().order_by()
+        moved = missing = 0
+        for name in names.iterator():
+            if not default_storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Missing file: {name}')
+                continue
+            with default_storage.open(name) as image:
+                new_name = default_storage.save(name, image)
+            if new_name == name:
+                continue
+            recipes = Recipe.objects.filter(image=name)
+            with transaction.atomic():
+                recipe_ids = list(recipes.values_list('id', flat=True))
+                recipes.update(image=new_name)
+                rebuild_documents(recipe_ids, touch=True)
+            default_storage.delete(name)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Rehashed {moved} images, {missing} missing'
+        ))
@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from django.utils import timezone
+
+from recipes.jobs import claim_jobs, fail_job, run_job, schedule_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.JOB_WORKERS,
+            help='Number of jobs run at the same time'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='Seconds between polls of an empty queue'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty'
+        )
+
+    def create_pool(self, concurrency):
+        # Процессы пула запускаются через spawn и открывают свои
+        # соединения с базой, а не наследуют соединение этого процесса.
+        return ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        )
+
+    def fail(self, job_id, error):
+        try:
+            status = fail_job(job_id, error)
+        except DatabaseError as db_error:
+            # Задачу заберёт следующий claim_jobs после JOB_TIMEOUT.
+            self.stderr.write(f'Job {job_id}: {db_error}')
+        else:
+            self.stdout.write(f'Job {job_id}: {status}')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        running = {}
+        scheduled_at = None
+        pool = self.create_pool(concurrency)
+        try:
+            while True:
+                now = timezone.now()
+                if scheduled_at is None or now - scheduled_at >= timedelta(
+                    minutes=1
+                ):
+                    schedule_jobs(now)
+                    scheduled_at = now
+                claimed = claim_jobs(concurrency - len(running))
+                for job_id in claimed:
+                    running[pool.submit(run_job, job_id)] = job_id
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(
+                    running, timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED
+                )
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        job_id, status = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        self.fail(job_id, traceback.format_exc())
+                    except Exception:
+                        self.fail(job_id, traceback.format_exc())
+                    else:
+                        self.stdout.write(f'Job {job_id}: {status}')
+                if broken:
+                    # Упавший процесс ломает весь пул: остальные задачи
+                    # в нём тоже не вернут результат.
+                    for job_id in running.values():
+                        self.fail(job_id, 'Пул воркера пересоздан')
+                    running.clear()
+                    pool.shutdown(wait=False)
+                    pool = self.create_pool(concurrency)
+        finally:
+            pool.shutdown()
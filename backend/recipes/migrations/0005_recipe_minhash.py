@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='minhash',
+            field=models.BinaryField(default=b'', verbose_name='MinHash-подпись ингредиентов'),
+        ),
+    ]
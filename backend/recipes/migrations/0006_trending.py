@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-19 15:20
+
+import datetime
+from django.db import migrations, models
+
+# Для уже существующих строк время добавления неизвестно: они получают
+# начальную эпоху популярности, то есть наименьший вес, а не now().
+BACKFILL_CREATED_AT = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_minhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=BACKFILL_CREATED_AT, verbose_name='Время добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, help_text='Сумма весов добавлений в избранное и корзину', verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='shopping_list',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=BACKFILL_CREATED_AT, verbose_name='Время добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-19 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_trending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, help_text='Загрузите ссылку на картинку к рецепту', upload_to='recipes/images/', verbose_name='Картинка'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2 on 2026-10-19 03:01
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 500
+
+
+def build_documents(apps, schema_editor):
+    """Документы существующих рецептов, как recipes.documents, пачками."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    recipe_ids = list(Recipe.objects.order_by('id').values_list(
+        'id', flat=True
+    ))
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        ids = recipe_ids[start:start + CHUNK_SIZE]
+        tags = {}
+        for link in Recipe.tags.through.objects.filter(
+            recipe_id__in=ids
+        ).select_related('tag').order_by('tag__name'):
+            tags.setdefault(link.recipe_id, []).append({
+                'id': link.tag.id,
+                'name': link.tag.name,
+                'color_code': link.tag.color_code,
+                'slug': link.tag.slug,
+            })
+        ingredients = {}
+        for item in RecipeIngredient.objects.filter(
+            recipe_id__in=ids
+        ).select_related('ingredient').order_by('id'):
+            ingredients.setdefault(item.recipe_id, []).append({
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'amount': item.amount,
+                'measurement_unit': item.ingredient.measurement_unit,
+            })
+        recipes = list(Recipe.objects.filter(id__in=ids).select_related(
+            'author'
+        ).defer('minhash'))
+        for recipe in recipes:
+            recipe.document = {
+                'id': recipe.id,
+                'tags': tags.get(recipe.id, []),
+                'author': {
+                    'id': recipe.author.id,
+                    'email': recipe.author.email,
+                    'username': recipe.author.username,
+                    'first_name': recipe.author.first_name,
+                    'last_name': recipe.author.last_name,
+                },
+                'ingredients': ingredients.get(recipe.id, []),
+                'name': recipe.name,
+                'image': recipe.image.url if recipe.image else None,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            }
+        Recipe.objects.bulk_update(recipes, ['document'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_sync_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='document',
+            field=models.JSONField(default=dict, editable=False, help_text='Готовое представление для API без полей пользователя', verbose_name='Документ рецепта'),
+        ),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
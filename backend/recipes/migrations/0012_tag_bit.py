@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-19 03:13
+
+from django.db import migrations, models
+
+MAX_TAGS = 63
+CHUNK_SIZE = 2000
+
+
+def assign_bits(apps, schema_editor):
+    """Раздаёт биты первым MAX_TAGS тегам и пересчитывает маски рецептов."""
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    bits = {}
+    for bit, tag in enumerate(Tag.objects.order_by('id')[:MAX_TAGS]):
+        tag.bit = bit
+        tag.save(update_fields=['bit'])
+        bits[tag.id] = bit
+    masks = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    ).iterator():
+        if tag_id in bits:
+            masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bits[tag_id]
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        recipes = [
+            Recipe(id=recipe_id, tags_mask=masks.get(recipe_id, 0))
+            for recipe_id in recipe_ids[start:start + CHUNK_SIZE]
+        ]
+        Recipe.objects.bulk_update(recipes, ['tags_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, help_text='Номер бита в Recipe.tags_mask, выдаётся при создании', null=True, unique=True, verbose_name='Бит тега'),
+        ),
+        migrations.RunPython(assign_bits, migrations.RunPython.noop),
+    ]
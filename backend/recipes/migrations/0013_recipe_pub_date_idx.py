@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-19 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_tag_bit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(is_deleted=False), fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+    ]
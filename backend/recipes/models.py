@@ -1,11 +1,22 @@
 from colorfield.fields import ColorField
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connections,
+    models,
+    transaction,
+)
 from django.db.models import UniqueConstraint
+from django.utils import timezone
 
 from users.models import User
 
+# Ключ advisory-блокировки эпохи популярности.
+TRENDING_LOCK = 7360
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -19,6 +30,10 @@ class Ingredient(models.Model):
         max_length=settings.MAX_LENGTH,
         verbose_name="Единица измерения",
         help_text="Введите название единицы измерения",
+    )
+    updated_at = models.DateTimeField(
+        "Время изменения",
+        auto_now=True,
         db_index=True,
     )
 
@@ -59,6 +74,18 @@ class Tag(models.Model):
         help_text="Введите слаг тега",
         db_index=True,
     )
+    updated_at = models.DateTimeField(
+        "Время изменения",
+        auto_now=True,
+        db_index=True,
+    )
+    bit = models.PositiveSmallIntegerField(
+        unique=True,
+        null=True,
+        editable=False,
+        verbose_name="Бит тега",
+        help_text="Номер бита в Recipe.tags_mask, выдаётся при создании",
+    )
 
     class Meta:
         ordering = ("name",)
@@ -68,6 +95,58 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.bit is None and get_free_tag_bit() is None:
+            raise ValidationError(
+                f"Нельзя создать больше {settings.MAX_TAGS} тегов"
+            )
+
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        # Параллельно созданный тег может занять тот же свободный бит:
+        # тогда вставку отклонит уникальность bit и берётся следующий.
+        for _ in range(settings.MAX_TAGS):
+            self.bit = get_free_tag_bit()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if self.bit is None or not Tag.objects.filter(
+                    bit=self.bit
+                ).exists():
+                    raise
+        raise IntegrityError("Не удалось выделить бит тега")
+
+
+def get_free_tag_bit():
+    """Младший свободный бит маски или None, если заняты все MAX_TAGS."""
+    used = set(
+        Tag.objects.exclude(bit=None).values_list('bit', flat=True)
+    )
+    return next(
+        (bit for bit in range(settings.MAX_TAGS) if bit not in used), None
+    )
+
+
+def get_bits_mask(bits):
+    """Битовая маска для Recipe.tags_mask из Tag.bit; None пропускается.
+
+    Тег без бита (старые данные сверх MAX_TAGS) в маску не попадает,
+    фильтры для него используют обычное соединение с тегами.
+    """
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def get_tags_mask(tag_ids):
+    return get_bits_mask(
+        Tag.objects.filter(pk__in=list(tag_ids)).values_list('bit', flat=True)
+    )
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -76,18 +155,18 @@ class Recipe(models.Model):
         on_delete=models.CASCADE,
         related_name="recipes",
         verbose_name="Автор рецепта",
-        db_index=True,
+        db_index=False,
     )
     name = models.CharField(
         max_length=settings.MAX_LENGTH,
         verbose_name="Название рецепта",
         help_text="Введите название рецепта",
-        db_index=True,
     )
     image = models.ImageField(
         verbose_name="Картинка",
         help_text="Загрузите ссылку на картинку к рецепту",
         upload_to=settings.PATH_TO_FILES,
+        db_index=True,
     )
     text = models.TextField(
         max_length=settings.MAX_LENGTH,
@@ -102,6 +181,12 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(Tag,
                                   related_name="recipes",
                                   verbose_name="Тэг")
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Маска тегов",
+        help_text="Биты тегов рецепта, обновляются при изменении tags",
+    )
 
     cooking_time = models.PositiveIntegerField(
         verbose_name="Время приготовления",
@@ -115,15 +200,102 @@ class Recipe(models.Model):
         "Время публикации",
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        "Время изменения",
+        auto_now=True,
+        db_index=True,
+    )
+    minhash = models.BinaryField(
+        default=b"",
+        editable=False,
+        verbose_name="MinHash-подпись ингредиентов",
+    )
+    is_deleted = models.BooleanField(
+        default=False,
+        verbose_name="Ожидает удаления",
+        help_text="Рецепт скрыт и будет удалён командой purge_deleted",
+        db_index=True,
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name="Популярность",
+        help_text="Сумма весов добавлений в избранное и корзину",
+    )
+    document = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name="Документ рецепта",
+        help_text="Готовое представление для API без полей пользователя",
+    )
 
     class Meta:
         ordering = ("-pub_date",)
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["-trending_score", "-id"],
+                name="recipe_trending_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date"],
+                name="recipe_author_pub_date_idx",
+            ),
+            # Лента и фильтр по тегам идут по этому индексу от новых
+            # рецептов к старым, проверяя tags_mask, без сортировки.
+            models.Index(
+                fields=["-pub_date"],
+                name="recipe_pub_date_idx",
+                condition=models.Q(is_deleted=False),
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def soft_delete(self):
+        self.is_deleted = True
+        self.save(update_fields=["is_deleted", "updated_at"])
+
+
+def get_trending_weight(moment=None, epoch=None):
+    """Вес события в Recipe.trending_score.
+
+    Вес растёт вдвое за каждый TRENDING_HALF_LIFE от эпохи, поэтому
+    сортировка по сумме весов совпадает с сортировкой по популярности,
+    затухающей с тем же периодом полураспада.
+    """
+    moment = moment or timezone.now()
+    epoch = epoch or settings.TRENDING_EPOCH
+    return 2 ** ((moment - epoch) / settings.TRENDING_HALF_LIFE)
+
+
+def lock_trending_epoch(exclusive=False):
+    """Текущая эпоха весов под блокировкой до конца транзакции.
+
+    Изменения популярности берут блокировку разделяемой, а
+    compact_trending — исключительной: вес события и счёт рецепта
+    всегда считаются от одной эпохи. Блокировка только на PostgreSQL.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == "postgresql":
+        function = (
+            "pg_advisory_xact_lock" if exclusive
+            else "pg_advisory_xact_lock_shared"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {function}(%s)", [TRENDING_LOCK])
+    epoch = TrendingEpoch.objects.using(DEFAULT_DB_ALIAS).values_list(
+        "started_at", flat=True
+    ).first()
+    return epoch or settings.TRENDING_EPOCH
+
+
+def raw_delete(queryset):
+    """Один DELETE по условию queryset без загрузки строк и сигналов."""
+    return queryset._raw_delete(queryset.db)
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -131,6 +303,7 @@ class RecipeIngredient(models.Model):
         on_delete=models.CASCADE,
         related_name="ingredient_in_recipe",
         verbose_name="Рецепт",
+        db_index=False,
     )
     ingredient = models.ForeignKey(
         Ingredient,
@@ -157,6 +330,15 @@ class RecipeIngredient(models.Model):
                 fields=["ingredient", "recipe"],
             ),
         ]
+        # Для суммирования корзины по рецептам; на PostgreSQL amount
+        # берётся из индекса без чтения таблицы.
+        indexes = [
+            models.Index(
+                fields=["recipe", "ingredient"],
+                include=["amount"],
+                name="recipeingredient_recipe_idx",
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} - {self.amount}'
@@ -175,6 +357,11 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         verbose_name="Избранный рецепт",
     )
+    created_at = models.DateTimeField(
+        "Время добавления",
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ("user",)
@@ -190,14 +377,21 @@ class Favorite(models.Model):
 
 
 class Shopping_list(models.Model):
+    # Корзина пользователя читается по индексу cart_is_unique (user, recipe).
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
-        verbose_name="Пользователь"
+        verbose_name="Пользователь",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE,
         verbose_name="Рецепт в корзине"
     )
+    created_at = models.DateTimeField(
+        "Время добавления",
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = "Рецепт в корзине"
@@ -209,3 +403,171 @@ class Shopping_list(models.Model):
 
     def __str__(self):
         return f"{self.recipe} планирует приготовить {self.user}"
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    )
+
+    name = models.CharField(
+        max_length=settings.MAX_LENGTH_100,
+        verbose_name="Задача",
+    )
+    payload = models.JSONField(
+        default=dict,
+        verbose_name="Аргументы",
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+        verbose_name="Статус",
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Попытки",
+    )
+    max_attempts = models.PositiveIntegerField(
+        default=5,
+        verbose_name="Максимум попыток",
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Запустить не раньше",
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Занята воркером до",
+    )
+    idempotency_key = models.CharField(
+        max_length=settings.MAX_LENGTH_100,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="Ключ идемпотентности",
+    )
+    user = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="jobs",
+        verbose_name="Пользователь",
+    )
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Результат",
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Ошибка",
+    )
+    created_at = models.DateTimeField(
+        "Время создания",
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        "Время изменения",
+        auto_now=True,
+    )
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(
+                fields=["status", "run_at"],
+                name="job_status_run_at_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class Deletion(models.Model):
+    """Запись об удалении объекта для инкрементальной синхронизации."""
+
+    kind = models.CharField(
+        max_length=20,
+        verbose_name="Тип объекта",
+    )
+    object_id = models.BigIntegerField(
+        verbose_name="Id объекта",
+    )
+    # Не внешний ключ: запись должна пережить удаление пользователя.
+    user_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Id пользователя",
+        help_text="Для избранного и корзины — их владелец",
+    )
+    deleted_at = models.DateTimeField(
+        "Время удаления",
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = "Удаление"
+        verbose_name_plural = "Удаления"
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class ImportProgress(models.Model):
+    """Сколько строк файла уже импортировала команда import_recipes.
+
+    Обновляется в транзакции пачки, поэтому после сбоя импорт
+    продолжается ровно с первой незаписанной строки.
+    """
+
+    source = models.CharField(
+        max_length=settings.MAX_LENGTH,
+        unique=True,
+        verbose_name="Файл импорта",
+    )
+    lines = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Обработано строк",
+    )
+    updated_at = models.DateTimeField(
+        "Время изменения",
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = "Прогресс импорта"
+        verbose_name_plural = "Прогресс импорта"
+
+    def __str__(self):
+        return f"{self.source}: {self.lines}"
+
+
+class TrendingEpoch(models.Model):
+    """Эпоха, от которой считаются веса популярности.
+
+    Пока строки нет, эпоха — TRENDING_EPOCH; compact_trending сдвигает
+    её вперёд и пересчитывает счёт рецептов одним UPDATE.
+    """
+
+    started_at = models.DateTimeField("Начало отсчёта")
+
+    class Meta:
+        verbose_name = "Эпоха популярности"
+        verbose_name_plural = "Эпоха популярности"
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M}"
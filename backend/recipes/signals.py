@@ -0,0 +1,247 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import User
+
+from .documents import AUTHOR_FIELDS, rebuild_documents
+from .index import ingredient_index
+from .models import (
+    Deletion,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Shopping_list,
+    Tag,
+    get_bits_mask,
+    get_tags_mask,
+)
+from .storage import lock_file
+
+DOCUMENT_SOURCES = {
+    User: AUTHOR_FIELDS,
+    Ingredient: ('name', 'measurement_unit'),
+    Tag: ('name', 'color_code', 'slug'),
+}
+DELETION_KINDS = {
+    Recipe: 'recipes',
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+    Favorite: 'favorites',
+    Shopping_list: 'shopping_cart',
+}
+
+
+class DeletingRecipes(threading.local):
+    """Рецепты, которые сейчас удаляет Collector.
+
+    pre_delete для всех объектов каскада приходит раньше, чем
+    post_delete зависимых строк.
+    """
+
+    def __init__(self):
+        self.ids = set()
+
+
+deleting_recipes = DeletingRecipes()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action == 'pre_clear':
+            clear_tag_bit(instance)
+        elif action in ('post_add', 'post_remove'):
+            update_recipes_mask(pk_set, get_bits_mask([instance.bit]), action)
+            rebuild_documents(pk_set)
+        elif action == 'post_clear':
+            rebuild_documents(instance._cleared_recipe_ids)
+        return
+    if action == 'post_clear':
+        instance.tags_mask = 0
+    elif action == 'post_add':
+        instance.tags_mask |= get_tags_mask(pk_set)
+    elif action == 'post_remove':
+        instance.tags_mask &= ~get_tags_mask(pk_set)
+    else:
+        return
+    Recipe.objects.filter(pk=instance.pk).update(
+        tags_mask=instance.tags_mask, updated_at=timezone.now()
+    )
+    rebuild_documents([instance.pk])
+
+
+@receiver(pre_delete, sender=Tag)
+def delete_tag(sender, instance, **kwargs):
+    clear_tag_bit(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def rebuild_tag_documents(sender, instance, **kwargs):
+    rebuild_documents(instance._cleared_recipe_ids)
+
+
+def update_recipes_mask(recipe_ids, mask, action):
+    if not mask:
+        return
+    if action == 'post_add':
+        tags_mask = F('tags_mask').bitor(mask)
+    else:
+        tags_mask = F('tags_mask').bitand(~mask)
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        tags_mask=tags_mask, updated_at=timezone.now()
+    )
+
+
+def clear_tag_bit(tag):
+    tag._cleared_recipe_ids = list(
+        tag.recipes.values_list('id', flat=True)
+    )
+    mask = get_bits_mask([tag.bit])
+    if not mask:
+        return
+    Recipe.objects.alias(
+        tag_bit=F('tags_mask').bitand(mask)
+    ).filter(tag_bit__gt=0).update(
+        tags_mask=F('tags_mask').bitand(~mask), updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_ingredient_index(sender, instance, **kwargs):
+    """Помечает рецепт после коммита, когда строки ингредиентов записаны.
+
+    Иначе параллельный поиск перечитает рецепт до bulk_create
+    ингредиентов и снимет пометку.
+    """
+    recipe_id = instance.recipe_id if sender is RecipeIngredient else (
+        instance.pk
+    )
+    transaction.on_commit(lambda: ingredient_index.invalidate(recipe_id))
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    image = instance.__dict__.get('image')
+    instance._original_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Recipe)
+def delete_replaced_image(sender, instance, **kwargs):
+    original = getattr(instance, '_original_image', None)
+    if original and original != instance.image.name:
+        delete_unused_image(instance.image.storage, original)
+    instance._original_image = instance.image.name
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image(sender, instance, **kwargs):
+    if instance.image:
+        delete_unused_image(instance.image.storage, instance.image.name)
+
+
+def delete_unused_image(storage, name):
+    """Удаляет файл после коммита, если на него не ссылается ни один рецепт.
+
+    Картинки хранятся по хешу содержимого и могут быть общими для
+    нескольких рецептов, поэтому счётчиком ссылок служит сама таблица.
+    """
+    def delete():
+        with transaction.atomic():
+            lock_file(name)
+            if not Recipe.objects.filter(image=name).exists():
+                storage.delete(name)
+    transaction.on_commit(delete)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_deleting_recipe(sender, instance, **kwargs):
+    deleting_recipes.ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleting_recipe(sender, instance, **kwargs):
+    deleting_recipes.ids.discard(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def touch_recipe(sender, instance, **kwargs):
+    # Каскад при удалении рецепта: трогать и пересобирать нечего.
+    if instance.recipe_id in deleting_recipes.ids:
+        return
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        updated_at=timezone.now()
+    )
+    rebuild_documents([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def rebuild_recipe_document(sender, instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) <= {
+        'is_deleted', 'updated_at', 'trending_score', 'minhash'
+    }:
+        return
+    rebuild_documents([instance.pk])
+
+
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=Ingredient)
+@receiver(post_init, sender=Tag)
+def remember_document_fields(sender, instance, **kwargs):
+    instance._document_fields = [
+        instance.__dict__.get(field) for field in DOCUMENT_SOURCES[sender]
+    ]
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+def rebuild_related_documents(sender, instance, created, **kwargs):
+    """Пересобирает документы после переименования автора, тега или
+    ингредиента; сохранения без изменения этих полей ничего не стоят.
+    """
+    fields = [getattr(instance, field) for field in DOCUMENT_SOURCES[sender]]
+    if created or fields == instance._document_fields:
+        return
+    instance._document_fields = fields
+    if sender is User:
+        recipes = Recipe.objects.filter(author=instance)
+    elif sender is Ingredient:
+        recipes = Recipe.objects.filter(
+            ingredient_in_recipe__ingredient=instance
+        )
+    else:
+        recipes = Recipe.objects.filter(tags=instance)
+    rebuild_documents(recipes.values_list('id', flat=True), touch=True)
+
+
+# Только синхронизируемые модели: получатель post_delete без sender
+# отключил бы быстрое удаление каскадом для всех моделей проекта.
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Shopping_list)
+def record_deletion(sender, instance, **kwargs):
+    kind = DELETION_KINDS[sender]
+    if sender in (Favorite, Shopping_list):
+        Deletion.objects.create(
+            kind=kind, object_id=instance.recipe_id, user_id=instance.user_id
+        )
+    else:
+        Deletion.objects.create(kind=kind, object_id=instance.pk)
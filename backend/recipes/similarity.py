@@ -0,0 +1,160 @@
+import hashlib
+import mmap
+import os
+import random
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+HEADER = struct.Struct('<8sIIQ')
+MAGIC = b'FGLSH001'
+
+_random = random.Random(1)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME))
+    for _ in range(settings.MINHASH_PERMUTATIONS)
+]
+
+
+def get_minhash(ingredient_ids):
+    """MinHash-подпись множества ингредиентов в виде байтов (uint32)."""
+    ingredient_ids = set(ingredient_ids)
+    signature = array('I', [MAX_HASH] * len(PERMUTATIONS))
+    for i, (a, b) in enumerate(PERMUTATIONS):
+        for ingredient_id in ingredient_ids:
+            value = (a * ingredient_id + b) % MERSENNE_PRIME & MAX_HASH
+            if value < signature[i]:
+                signature[i] = value
+    return signature.tobytes()
+
+
+def load_signature(raw):
+    signature = array('I')
+    signature.frombytes(raw)
+    return signature
+
+
+def get_band_keys(signature):
+    rows = settings.MINHASH_PERMUTATIONS // settings.MINHASH_BANDS
+    size = rows * signature.itemsize
+    raw = memoryview(signature).cast('B')
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                raw[band * size:(band + 1) * size], digest_size=8
+            ).digest(),
+            'little'
+        )
+        for band in range(settings.MINHASH_BANDS)
+    ]
+
+
+def write_index(path, signatures):
+    """Записывает индекс LSH из пар (id рецепта, подпись) в файл.
+
+    Формат: заголовок, отсортированные id, подписи в том же порядке,
+    затем для каждой полосы отсортированные ключи корзин и id рецептов.
+    Файл подменяется атомарно, читатели переоткрывают его по mtime.
+    """
+    signatures = sorted(signatures)
+    ids = array('q', [recipe_id for recipe_id, _ in signatures])
+    packed = array('I')
+    bands = [[] for _ in range(settings.MINHASH_BANDS)]
+    for recipe_id, signature in signatures:
+        signature = load_signature(signature)
+        packed.extend(signature)
+        for band, key in enumerate(get_band_keys(signature)):
+            bands[band].append((key, recipe_id))
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(HEADER.pack(
+            MAGIC, settings.MINHASH_PERMUTATIONS, settings.MINHASH_BANDS,
+            len(ids)
+        ))
+        ids.tofile(index_file)
+        packed.tofile(index_file)
+        for band in bands:
+            band.sort()
+            array('Q', [key for key, _ in band]).tofile(index_file)
+            array('q', [recipe_id for _, recipe_id in band]).tofile(
+                index_file
+            )
+    os.replace(tmp_path, path)
+
+
+class SimilarityIndex:
+    """Индекс LSH, отображённый в память и общий для всех воркеров."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.mmap = None
+
+    def load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.mmap = self.mtime = None
+            return False
+        if mtime == self.mtime:
+            return True
+        with open(self.path, 'rb') as index_file:
+            self.mmap = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        magic, permutations, bands, count = HEADER.unpack_from(self.mmap)
+        if (
+            magic != MAGIC
+            or permutations != settings.MINHASH_PERMUTATIONS
+            or bands != settings.MINHASH_BANDS
+        ):
+            self.mmap = None
+            return False
+        view = memoryview(self.mmap)
+        offset = HEADER.size
+        self.ids = view[offset:offset + count * 8].cast('q')
+        offset += count * 8
+        size = count * permutations * 4
+        self.signatures = view[offset:offset + size].cast('I')
+        offset += size
+        self.bands = []
+        for _ in range(bands):
+            keys = view[offset:offset + count * 8].cast('Q')
+            offset += count * 8
+            ids = view[offset:offset + count * 8].cast('q')
+            offset += count * 8
+            self.bands.append((keys, ids))
+        self.mtime = mtime
+        return True
+
+    def similar(self, recipe_id, signature, limit):
+        """Ближайшие по оценке Жаккара рецепты: [(id, сходство)]."""
+        signature = load_signature(signature)
+        permutations = len(signature)
+        with self.lock:
+            if not self.load():
+                return []
+            candidates = set()
+            for (keys, ids), key in zip(
+                self.bands, get_band_keys(signature)
+            ):
+                start = bisect_left(keys, key)
+                candidates.update(ids[start:bisect_right(keys, key, start)])
+            candidates.discard(recipe_id)
+            scores = []
+            for candidate in candidates:
+                position = bisect_left(self.ids, candidate) * permutations
+                other = self.signatures[position:position + permutations]
+                same = sum(a == b for a, b in zip(signature, other))
+                scores.append((same / permutations, candidate))
+        scores.sort(reverse=True)
+        return [(candidate, score) for score, candidate in scores[:limit]]
+
+
+similarity_index = SimilarityIndex(settings.SIMILARITY_INDEX_PATH)
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def lock_file(name, shared=False):
+    """Advisory-блокировка имени файла до конца текущей транзакции.
+
+    Запись картинки берёт её разделяемой, а удаление неиспользуемой —
+    исключительной, поэтому удаление ждёт коммита рецепта, который
+    ссылается на файл, и видит эту ссылку. Только PostgreSQL и только
+    внутри transaction.atomic.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True
+    )
+    function = (
+        'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 содержимого.
+
+    Файл сохраняется как <каталог>/<2 символа хеша>/<хеш><расширение>;
+    одинаковые картинки записываются на диск один раз.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        if posixpath.basename(directory) == digest[:2] and (
+            filename.startswith(digest)
+        ):
+            directory = posixpath.dirname(directory)
+        extension = os.path.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        # Файл проверяется под блокировкой: иначе его может удалить
+        # delete_unused_image, ещё не видящий рецепт с этой картинкой.
+        lock_file(name, shared=True)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+            for chunk in content.chunks():
+                tmp.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp.name, self.file_permissions_mode)
+        else:
+            os.chmod(tmp.name, 0o644)
+        os.replace(tmp.name, full_path)
+        return name
@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+
+from .export import iter_ndjson, parse_since
+from .jobs import task
+
+
+@task('export_recipes')
+def export_recipes(job_id, since=None, compress=False):
+    """Пишет выгрузку каталога в MEDIA_ROOT/exports и возвращает ссылку."""
+    directory = os.path.join(settings.MEDIA_ROOT, 'exports')
+    os.makedirs(directory, exist_ok=True)
+    filename = f'recipes-{job_id}.ndjson' + ('.gz' if compress else '')
+    path = os.path.join(directory, filename)
+    with open(path + '.tmp', 'wb') as output:
+        for line in iter_ndjson(
+            since and parse_since(since), compress=compress
+        ):
+            output.write(line)
+    os.replace(path + '.tmp', path)
+    return {'url': f'{settings.MEDIA_URL}exports/{filename}'}
+
+
+@task('purge_deleted')
+def purge_deleted(job_id):
+    call_command('purge_deleted')
+
+
+@task('build_similarity_index')
+def build_similarity_index(job_id):
+    call_command('build_similarity_index')
+
+
+@task('compact_trending')
+def compact_trending(job_id):
+    call_command('compact_trending')
@@ -5,7 +5,10 @@ from .models import Subscription, User
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ("username", "first_name", "last_name", "email")
+    list_display = (
+        "username", "first_name", "last_name", "email", "is_deleted"
+    )
+    list_filter = ("is_deleted",)
     search_fields = ("username", "first_name", "last_name", "email")
     ordering = ("username",)
     fieldsets = (
@@ -16,6 +19,7 @@ class UserAdmin(admin.ModelAdmin):
             {
                 "fields": (
                     "is_active",
+                    "is_deleted",
                     "is_staff",
                     "is_superuser",
                     "groups",
@@ -31,6 +35,13 @@ class UserAdmin(admin.ModelAdmin):
         ),
     )
 
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            user.soft_delete()
+
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
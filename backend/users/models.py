@@ -3,6 +3,7 @@ from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
 from django.db.models import UniqueConstraint
+from django.utils import timezone
 
 from .validators import validate_username
 
@@ -21,13 +22,11 @@ class User(AbstractUser):
     first_name = models.CharField(
         max_length=settings.MAX_LENGTH_100,
         blank=False,
-        verbose_name="Имя",
-        db_index=True,)
+        verbose_name="Имя",)
     last_name = models.CharField(
         max_length=settings.MAX_LENGTH_100,
         blank=False,
-        verbose_name="Фамилия",
-        db_index=True,)
+        verbose_name="Фамилия",)
     email = models.EmailField(
         max_length=settings.MAX_LENGTH_100,
         unique=True,
@@ -39,6 +38,11 @@ class User(AbstractUser):
         max_length=settings.MAX_LENGTH_100,
     )
     is_subscribed = models.BooleanField(default=False)
+    is_deleted = models.BooleanField(
+        default=False,
+        verbose_name="Ожидает удаления",
+        db_index=True,
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username",
@@ -56,6 +60,14 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def soft_delete(self):
+        self.is_deleted = True
+        self.is_active = False
+        self.save(update_fields=["is_deleted", "is_active"])
+        self.recipes.filter(is_deleted=False).update(
+            is_deleted=True, updated_at=timezone.now()
+        )
+
 
 class Subscription(models.Model):
 
@@ -64,12 +76,14 @@ class Subscription(models.Model):
         related_name="sub",
         on_delete=models.CASCADE,
         verbose_name="Подписчик",
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         related_name="author",
         on_delete=models.CASCADE,
         verbose_name="Автор",
+        db_index=False,
     )
 
     class Meta:
@@ -77,6 +91,14 @@ class Subscription(models.Model):
             UniqueConstraint(fields=["user", "author"],
                              name="user_author_unique")
         ]
+        # Подписки пользователя ищутся по user_author_unique,
+        # подписчики автора — по этому индексу.
+        indexes = [
+            models.Index(
+                fields=["author", "user"],
+                name="subscription_author_user_idx",
+            ),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
 